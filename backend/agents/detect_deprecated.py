@@ -4,6 +4,14 @@ from openai import OpenAI
 import json
 import logging
 
+# Fast JSON encoder for request bodies - falls back to stdlib json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
 logger = logging.getLogger("tenant-optimizer")
 
 async def detect_deprecated_resources(user_token, subscriptions):
@@ -47,12 +55,18 @@ async def detect_deprecated_resources(user_token, subscriptions):
         "query": query
     }
     
+    # Serialize the body once so httpx sends the bytes as-is
+    if ORJSON_AVAILABLE:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload).encode()
+    
     logger.info(f"🔍 Querying Resource Graph for potentially deprecated resources in {len(subscriptions)} subscriptions")
     logger.info(f"📡 Resource Graph URL: {url}")
     
     try:
         async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(url, headers=headers, json=payload)
+            resp = await client.post(url, headers=headers, content=body)
             logger.info(f"📡 Resource Graph response status: {resp.status_code}")
             
             if resp.status_code != 200:
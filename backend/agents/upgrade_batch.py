@@ -0,0 +1,37 @@
+"""
+Batch helpers shared by the upgrade agents' many-resource entry points.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+def unique_resource_ids(resource_ids: List[str]) -> List[str]:
+    """The IDs without repeats (ARM IDs are case-insensitive), each under its first spelling, in order."""
+    first_spelling: Dict[str, str] = {}
+    for rid in resource_ids:
+        first_spelling.setdefault(rid.lower(), rid)
+    return list(first_spelling.values())
+
+async def upgrade_each_once(resource_ids: List[str], upgrade: Callable[[str], Awaitable[Dict[str, Any]]],
+                            max_concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Run upgrade concurrently, at most max_concurrency at a time, once per resource.
+
+    Returns one result per ID in the order given. An ID given more than once is upgraded
+    once and its result repeated; an upgrade that raises gets a failure result instead.
+    """
+    unique_ids = unique_resource_ids(resource_ids)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def upgrade_one(resource_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await upgrade(resource_id)
+
+    results = await asyncio.gather(*(upgrade_one(rid) for rid in unique_ids), return_exceptions=True)
+    by_id = {
+        rid.lower(): {"success": False, "error": f"Upgrade process failed: {str(result)}", "resource_id": rid}
+        if isinstance(result, Exception) else result
+        for rid, result in zip(unique_ids, results)
+    }
+    # A copy per position, so callers annotating one result don't change its repeats
+    return [dict(by_id[rid.lower()]) for rid in resource_ids]
@@ -1,5 +1,3 @@
-import httpx
-import json
 import logging
 
 logger = logging.getLogger(__name__)
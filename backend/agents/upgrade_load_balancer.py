@@ -40,6 +40,17 @@ except ImportError as e:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared credential - DefaultAzureCredential caches tokens per instance, so one
+# instance per process avoids re-walking the credential chain for every agent
+_credential = None
+
+def _get_credential() -> DefaultAzureCredential:
+    """Return the process-wide DefaultAzureCredential, creating it on first use."""
+    global _credential
+    if _credential is None:
+        _credential = DefaultAzureCredential()
+    return _credential
+
 class LoadBalancerUpgradeAgent:
     """
     Automated agent for upgrading Load Balancers from Basic to Standard SKU.
@@ -49,7 +60,7 @@ class LoadBalancerUpgradeAgent:
     def __init__(self, subscription_id: str):
         """Initialize the upgrade agent."""
         self.subscription_id = subscription_id
-        self.credential = DefaultAzureCredential()
+        self.credential = _get_credential()
         self.network_client = NetworkManagementClient(self.credential, subscription_id)
         
     async def upgrade_load_balancer(self, resource_id: str) -> Dict[str, Any]:
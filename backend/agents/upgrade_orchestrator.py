@@ -16,43 +16,110 @@ Date: July 29, 2025
 """
 
 import asyncio
+import functools
+from datetime import datetime, timezone
 import logging
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Awaitable, Dict, List, Any, NamedTuple, Optional, Protocol, cast
 import json
-import importlib
-import sys
-import os
+import re
+import time
 
-# HTTP client for direct API calls
-try:
-    import httpx
-    HTTPX_AVAILABLE = True
-except ImportError:
-    HTTPX_AVAILABLE = False
-    httpx = None
+from .upgrade_public_ip import upgrade_public_ip_automated, close_shared_clients as close_public_ip_clients
+from .upgrade_load_balancer import upgrade_load_balancer_automated
+from .upgrade_storage_account import upgrade_storage_account_automated
 
-# Optional Azure SDK imports - graceful fallback if not available
-try:
-    from azure.identity import DefaultAzureCredential
-    from azure.mgmt.resource import ResourceManagementClient
-    AZURE_SDK_AVAILABLE = True
-except ImportError as e:
-    logging.warning(f"Azure SDK not available: {e}")
-    AZURE_SDK_AVAILABLE = False
-    # Create dummy classes to prevent import errors
-    class DefaultAzureCredential:
-        pass
-    class ResourceManagementClient:
-        pass
+# Logging is configured by the application entrypoint
+logger = logging.getLogger(__name__)
 
-# Add current directory to path for agent imports
-current_dir = os.path.dirname(os.path.abspath(__file__))
-if current_dir not in sys.path:
-    sys.path.append(current_dir)
+async def close_shared_clients():
+    """Close the shared clients of the agents (call on application shutdown)."""
+    await close_public_ip_clients()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Azure resource ID: /subscriptions/{sub}/resourceGroups/{rg}/providers/{namespace}/{type}/{name}[/...]
+_RESOURCE_ID_RE = re.compile(
+    r'^/?subscriptions/(?P<subscription>[^/]+)/resourceGroups/(?P<resource_group>[^/]+)'
+    r'/providers/(?P<namespace>[^/]+)/(?P<type>[^/]+)(?:/(?P<name>[^/]+))?',
+    re.IGNORECASE
+)
+
+class ResourceIdParts(NamedTuple):
+    """Components of an Azure resource ID; immutable, so cached parses can be shared."""
+    subscription: str
+    resource_group: str
+    namespace: str
+    type: str
+    name: Optional[str]
+    full_type: str
+
+@functools.lru_cache(maxsize=4096)
+def _parse_resource_id(resource_id: str) -> Optional[ResourceIdParts]:
+    """Parse an Azure resource ID into its components in a single regex pass (memoized per ID)."""
+    match = _RESOURCE_ID_RE.match(resource_id)
+    if not match:
+        return None
+    return ResourceIdParts(match['subscription'], match['resource_group'], match['namespace'],
+                           match['type'], match['name'], f"{match['namespace']}/{match['type']}")
+
+class UpgradeFunction(Protocol):
+    """Signature of each agent's `<module_name>_automated` entrypoint."""
+    def __call__(self, subscription_id: str, resource_id: str) -> Awaitable[Dict[str, Any]]: ...
+
+class TokenUpgradeFunction(Protocol):
+    """Entrypoint of an agent that can also run on the caller's ARM token and tenant."""
+    def __call__(self, subscription_id: str, resource_id: str, access_token: Optional[str] = None,
+                 tenant_id: Optional[str] = None) -> Awaitable[Dict[str, Any]]: ...
+
+# Agent module for each supported resource type
+AGENT_MODULES = {
+    'Microsoft.Network/publicIPAddresses': 'upgrade_public_ip',
+    'Microsoft.Network/loadBalancers': 'upgrade_load_balancer',
+    'Microsoft.Storage/storageAccounts': 'upgrade_storage_account'
+}
+
+# Upgrade entrypoint for each supported resource type
+AGENT_REGISTRY: Dict[str, UpgradeFunction] = {
+    'Microsoft.Network/publicIPAddresses': upgrade_public_ip_automated,
+    'Microsoft.Network/loadBalancers': upgrade_load_balancer_automated,
+    'Microsoft.Storage/storageAccounts': upgrade_storage_account_automated
+}
+
+# Resource types whose entrypoint is a TokenUpgradeFunction; the others only take the ids
+TOKEN_AGENT_TYPES = frozenset({'Microsoft.Network/publicIPAddresses'})
+
+class AsyncRateLimiter:
+    """Token-bucket rate limiter: allows `rate` acquisitions per `period` seconds, bursting up to `rate`."""
+    
+    def __init__(self, rate: int, period: float):
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a token is available and consume it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.period)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.period / self.rate)
+
+# ARM allows 1200 writes/hour per subscription; an upgrade issues up to three
+# writes (dissociate, SKU change, reassociate), so budget 400 upgrades/hour
+ARM_UPGRADES_PER_HOUR = 400
+_rate_limiters: Dict[str, AsyncRateLimiter] = {}
+
+def _get_rate_limiter(subscription_id: str) -> AsyncRateLimiter:
+    """Return the shared upgrade rate limiter for a subscription."""
+    limiter = _rate_limiters.get(subscription_id)
+    if limiter is None:
+        limiter = AsyncRateLimiter(ARM_UPGRADES_PER_HOUR, 3600)
+        _rate_limiters[subscription_id] = limiter
+    return limiter
 
 class AutomatedUpgradeOrchestrator:
     """
@@ -60,55 +127,32 @@ class AutomatedUpgradeOrchestrator:
     Coordinates multiple specialized agents for different resource types.
     """
     
-    def __init__(self, subscription_id: str, access_token: str = None, tenant_id: str = None):
+    # Upgrade order - Load Balancers last since they depend on Public IPs
+    DEPENDENCY_PRIORITY = {
+        'Microsoft.Network/publicIPAddresses': 1,
+        'Microsoft.Storage/storageAccounts': 2,
+        'Microsoft.Network/loadBalancers': 3,
+    }
+    
+    def __init__(self, subscription_id: str, access_token: str = None, tenant_id: str = None,
+                 max_concurrency: int = 8):
         """Initialize the orchestrator."""
         self.subscription_id = subscription_id
         self.access_token = access_token
         self.tenant_id = tenant_id
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = _get_rate_limiter(subscription_id)
         
-        # If we have access token, use it for HTTP calls (preferred)
-        if access_token and HTTPX_AVAILABLE:
-            self.credential = None
-            self.resource_client = None
+        # The agents fetch and authenticate on their own: with the user's access token
+        # when one is given, otherwise with DefaultAzureCredential
+        if access_token:
             logger.info("🔑 Orchestrator using user access token for authentication")
         else:
-            # Try Azure SDK as fallback
-            try:
-                if AZURE_SDK_AVAILABLE:
-                    self.credential = DefaultAzureCredential()
-                    self.resource_client = ResourceManagementClient(self.credential, subscription_id)
-                    logger.info("🔑 Orchestrator using DefaultAzureCredential for authentication")
-                else:
-                    raise Exception("Azure SDK not available")
-            except Exception as e:
-                logger.warning(f"⚠️ Azure SDK authentication failed: {e}")
-                self.credential = None
-                self.resource_client = None
+            logger.info("🔑 Orchestrator using DefaultAzureCredential for authentication")
         
         # Track available agents
-        self.agents = {
-            'Microsoft.Network/publicIPAddresses': 'upgrade_public_ip',
-            'Microsoft.Network/loadBalancers': 'upgrade_load_balancer', 
-            'Microsoft.Storage/storageAccounts': 'upgrade_storage_account'
-        }
-        
-    async def _get_resource_via_http(self, resource_id: str) -> Dict[str, Any]:
-        """Get resource information using HTTP API calls with access token."""
-        if not self.access_token or not HTTPX_AVAILABLE:
-            raise Exception("HTTP API access not available - no access token or httpx not installed")
-            
-        url = f"https://management.azure.com{resource_id}?api-version=2021-04-01"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        async with httpx.AsyncClient(timeout=60) as client:
-            response = await client.get(url, headers=headers)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                raise Exception(f"Failed to get resource: {response.status_code} - {response.text}")
+        self.agents = AGENT_MODULES
         
     async def upgrade_resource(self, resource_id: str, resource_type: str = None) -> Dict[str, Any]:
         """
@@ -122,7 +166,7 @@ class AutomatedUpgradeOrchestrator:
             Dict containing upgrade results and details
         """
         try:
-            logger.info(f"Starting automated upgrade orchestration for: {resource_id}")
+            logger.info("Starting automated upgrade orchestration for: %s", resource_id)
             
             # Determine resource type from ID if not provided
             if not resource_type:
@@ -142,13 +186,8 @@ class AutomatedUpgradeOrchestrator:
                     "supported_types": list(self.agents.keys())
                 }
                 
-            # Get resource details for context
-            resource_details = await self._get_resource_details(resource_id)
-            
-            # Execute the appropriate upgrade agent
-            upgrade_result = await self._execute_upgrade_agent(
-                resource_type, resource_id, resource_details
-            )
+            # Execute the appropriate upgrade agent (agents fetch the resource themselves)
+            upgrade_result = await self._execute_upgrade_agent(resource_type, resource_id)
             
             # Enhance result with orchestration metadata
             if upgrade_result.get('success', False):
@@ -158,14 +197,14 @@ class AutomatedUpgradeOrchestrator:
                     'automation_level': 'Full',
                     'timestamp': self._get_timestamp()
                 }
-                logger.info(f"Automated upgrade completed successfully: {resource_id}")
+                logger.info("Automated upgrade completed successfully: %s", resource_id)
             else:
-                logger.error(f"Automated upgrade failed: {resource_id} - {upgrade_result.get('error', 'Unknown error')}")
+                logger.error("Automated upgrade failed: %s - %s", resource_id, upgrade_result.get('error', 'Unknown error'))
                 
             return upgrade_result
             
         except Exception as e:
-            logger.error(f"Orchestration failed: {str(e)}")
+            logger.error("Orchestration failed: %s", e)
             return {
                 "success": False,
                 "error": f"Orchestration process failed: {str(e)}",
@@ -183,10 +222,10 @@ class AutomatedUpgradeOrchestrator:
             Dict containing results for all resources
         """
         try:
-            logger.info(f"Starting batch upgrade for {len(resource_list)} resources")
+            logger.info("Starting batch upgrade for %s resources", len(resource_list))
             
-            # Sort resources by dependency order (Public IPs first, then LBs)
-            sorted_resources = self._sort_by_dependencies(resource_list)
+            # Group resources into dependency tiers (Public IPs first, then LBs)
+            tiers = self._group_by_dependencies(resource_list)
             
             results = {
                 'success': True,
@@ -197,191 +236,136 @@ class AutomatedUpgradeOrchestrator:
                 'individual_results': []
             }
             
-            # Process resources in dependency order
-            for resource_info in sorted_resources:
-                resource_id = resource_info['id']
-                resource_type = resource_info.get('type')
-                
-                logger.info(f"Processing resource: {resource_id}")
+            # Process tiers in dependency order; resources within a tier are
+            # independent, so upgrade them concurrently (bounded to avoid ARM throttling)
+            for tier in tiers:
+                logger.info("Processing tier of %s resources", len(tier))
                 
-                # Execute upgrade
-                upgrade_result = await self.upgrade_resource(resource_id, resource_type)
+                async with asyncio.TaskGroup() as task_group:
+                    tasks = [task_group.create_task(self._upgrade_with_capture(r)) for r in tier]
                 
-                # Update counters
-                if upgrade_result.get('success', False):
-                    if upgrade_result.get('skipped', False):
-                        results['skipped_upgrades'] += 1
+                for task in tasks:
+                    individual_result = task.result()
+                    upgrade_result = individual_result['result']
+                    
+                    # Update counters
+                    if upgrade_result.get('success', False):
+                        if upgrade_result.get('skipped', False):
+                            results['skipped_upgrades'] += 1
+                        else:
+                            results['successful_upgrades'] += 1
                     else:
-                        results['successful_upgrades'] += 1
-                else:
-                    results['failed_upgrades'] += 1
-                    results['success'] = False  # Overall batch fails if any resource fails
-                
-                # Store individual result
-                results['individual_results'].append({
-                    'resource_id': resource_id,
-                    'resource_type': resource_type,
-                    'result': upgrade_result
-                })
-                
-                # Add delay between resources to avoid throttling
-                await asyncio.sleep(2)
+                        results['failed_upgrades'] += 1
+                        results['success'] = False  # Overall batch fails if any resource fails
+                    
+                    # Store individual result
+                    results['individual_results'].append(individual_result)
             
-            logger.info(f"Batch upgrade completed. Success: {results['successful_upgrades']}, "
-                       f"Failed: {results['failed_upgrades']}, Skipped: {results['skipped_upgrades']}")
+            logger.info("Batch upgrade completed. Success: %s, Failed: %s, Skipped: %s",
+                        results['successful_upgrades'], results['failed_upgrades'], results['skipped_upgrades'])
             
             return results
             
         except Exception as e:
-            logger.error(f"Batch upgrade failed: {str(e)}")
+            logger.error("Batch upgrade failed: %s", e)
             return {
                 "success": False,
                 "error": f"Batch upgrade process failed: {str(e)}"
             }
     
-    def _extract_resource_type(self, resource_id: str) -> Optional[str]:
-        """Extract resource type from Azure resource ID."""
-        try:
-            parts = resource_id.strip('/').split('/')
-            if len(parts) >= 7:
-                provider = parts[5]  # Microsoft.Network, Microsoft.Storage, etc.
-                resource_type = parts[6]  # publicIPAddresses, loadBalancers, etc.
-                return f"{provider}/{resource_type}"
-        except Exception as e:
-            logger.error(f"Failed to extract resource type: {str(e)}")
-        return None
-    
-    async def _get_resource_details(self, resource_id: str) -> Optional[Dict[str, Any]]:
-        """Get basic resource details for context."""
-        try:
-            # Use HTTP API if access token is available
-            if self.access_token:
-                resource_data = await self._get_resource_via_http(resource_id)
-                return {
-                    'name': resource_data.get('name', ''),
-                    'type': resource_data.get('type', ''),
-                    'location': resource_data.get('location', ''),
-                    'properties': resource_data.get('properties', {}),
-                    'sku': resource_data.get('sku', {})
-                }
+    async def upgrade_multiple_resources_streaming(self, resource_list: List[Dict[str, str]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Upgrade multiple resources with dependency resolution, yielding each result as it completes.
+        
+        Tiers still run in dependency order; within a tier results arrive in completion order.
+        
+        Args:
+            resource_list: List of dicts with 'id' and optionally 'type' keys
             
-            # Fallback to Azure SDK
-            elif self.resource_client:
-                # Extract resource group and name from ID
-                parts = resource_id.strip('/').split('/')
-                if len(parts) >= 8:
-                    resource_group = parts[3]
-                    resource_name = parts[-1]
-                    provider_namespace = parts[5]
-                    resource_type = parts[6]
-                    
-                    # Get resource using the Resource Management API
-                    resource = self.resource_client.resources.get(
-                        resource_group_name=resource_group,
-                        resource_provider_namespace=provider_namespace,
-                        parent_resource_path='',
-                        resource_type=resource_type,
-                        resource_name=resource_name,
-                        api_version='2021-04-01'
-                    )
-                    
-                    return {
-                        'name': resource.name,
-                        'location': resource.location,
-                        'type': resource.type,
-                        'properties': getattr(resource, 'properties', {}),
-                        'sku': getattr(resource, 'sku', {}),
-                        'tags': resource.tags
-                    }
-            else:
-                raise Exception("No authentication method available")
-                
-        except Exception as e:
-            logger.warning(f"Could not get resource details: {str(e)}")
-        return None
+        Yields:
+            Dicts with 'resource_id', 'resource_type' and 'result' keys
+        """
+        logger.info("Starting streaming batch upgrade for %s resources", len(resource_list))
+        
+        for tier in self._group_by_dependencies(resource_list):
+            tasks = [asyncio.create_task(self._upgrade_with_capture(r)) for r in tier]
+            try:
+                for next_result in asyncio.as_completed(tasks):
+                    yield await next_result
+            finally:
+                # Don't leave upgrades running if the consumer stops early
+                for task in tasks:
+                    task.cancel()
     
-    async def _execute_upgrade_agent(self, resource_type: str, resource_id: str, 
-                                   resource_details: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-        """Execute the appropriate upgrade agent for the resource type."""
-        try:
-            agent_module_name = self.agents[resource_type]
-            
-            # Import the agent module dynamically
+    async def _upgrade_with_capture(self, resource_info: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Upgrade one batch resource under the concurrency limit.
+        
+        Never raises, so one failure doesn't cancel the rest of its task group.
+        """
+        resource_id = resource_info['id']
+        resource_type = resource_info.get('type')
+        async with self._semaphore:
             try:
-                agent_module = importlib.import_module(agent_module_name)
-            except ImportError as e:
-                logger.error(f"Could not import agent module {agent_module_name}: {str(e)}")
-                return {
+                upgrade_result = await self.upgrade_resource(resource_id, resource_type)
+            except Exception as e:
+                logger.error("Upgrade task failed for %s: %s", resource_id, e)
+                upgrade_result = {
                     "success": False,
-                    "error": f"Agent module not available: {agent_module_name}"
+                    "error": f"Upgrade task failed: {str(e)}",
+                    "resource_id": resource_id
                 }
+        return {
+            'resource_id': resource_id,
+            'resource_type': resource_type,
+            'result': upgrade_result
+        }
+    
+    @staticmethod
+    def _extract_resource_type(resource_id: str) -> Optional[str]:
+        """Extract resource type from Azure resource ID."""
+        parts = _parse_resource_id(resource_id)
+        return parts.full_type if parts else None
+    
+    async def _execute_upgrade_agent(self, resource_type: str, resource_id: str) -> Dict[str, Any]:
+        """Execute the appropriate upgrade agent for the resource type."""
+        try:
+            agent_function = AGENT_REGISTRY[resource_type]
             
-            # Call the appropriate upgrade function
-            if resource_type == 'Microsoft.Network/publicIPAddresses':
-                if hasattr(agent_module, 'upgrade_public_ip_automated'):
-                    if self.access_token:
-                        return await agent_module.upgrade_public_ip_automated(
-                            self.subscription_id, resource_id, self.access_token, self.tenant_id
-                        )
-                    else:
-                        return await agent_module.upgrade_public_ip_automated(
-                            self.subscription_id, resource_id
-                        )
-                    
-            elif resource_type == 'Microsoft.Network/loadBalancers':
-                if hasattr(agent_module, 'upgrade_load_balancer_automated'):
-                    if self.access_token:
-                        return await agent_module.upgrade_load_balancer_automated(
-                            self.subscription_id, resource_id, self.access_token, self.tenant_id
-                        )
-                    else:
-                        return await agent_module.upgrade_load_balancer_automated(
-                            self.subscription_id, resource_id
-                        )
-                    
-            elif resource_type == 'Microsoft.Storage/storageAccounts':
-                if hasattr(agent_module, 'upgrade_storage_account_automated'):
-                    if self.access_token:
-                        return await agent_module.upgrade_storage_account_automated(
-                            self.subscription_id, resource_id, self.access_token, self.tenant_id
-                        )
-                    else:
-                        return await agent_module.upgrade_storage_account_automated(
-                            self.subscription_id, resource_id
-                        )
+            # Only waits when the subscription is close to the ARM write quota
+            await self.rate_limiter.acquire()
             
-            return {
-                "success": False,
-                "error": f"Upgrade function not found in agent module: {agent_module_name}"
-            }
+            if self.access_token and resource_type in TOKEN_AGENT_TYPES:
+                return await cast(TokenUpgradeFunction, agent_function)(
+                    self.subscription_id, resource_id, self.access_token, self.tenant_id
+                )
+            return await agent_function(self.subscription_id, resource_id)
             
         except Exception as e:
-            logger.error(f"Agent execution failed: {str(e)}")
+            logger.error("Agent execution failed: %s", e)
             return {
                 "success": False,
                 "error": f"Agent execution failed: {str(e)}"
             }
     
-    def _sort_by_dependencies(self, resource_list: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        """Sort resources by upgrade dependencies (Public IPs before Load Balancers)."""
-        priority_order = {
-            'Microsoft.Network/publicIPAddresses': 1,
-            'Microsoft.Storage/storageAccounts': 2,
-            'Microsoft.Network/loadBalancers': 3,  # Load Balancers last (depend on Public IPs)
-        }
-        
-        def get_priority(resource_info):
-            resource_type = resource_info.get('type')
-            if not resource_type:
-                resource_type = self._extract_resource_type(resource_info['id'])
-            return priority_order.get(resource_type, 999)
-        
-        return sorted(resource_list, key=get_priority)
+    def _get_priority(self, resource_info: Dict[str, str]) -> int:
+        """Get the dependency priority of a resource (lower upgrades first)."""
+        resource_type = resource_info.get('type')
+        if not resource_type:
+            resource_type = self._extract_resource_type(resource_info['id'])
+        return self.DEPENDENCY_PRIORITY.get(resource_type, 999)
+    
+    def _group_by_dependencies(self, resource_list: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        """Bucket resources into dependency tiers in a single pass, in upgrade order."""
+        buckets: Dict[int, List[Dict[str, str]]] = {}
+        for resource_info in resource_list:
+            buckets.setdefault(self._get_priority(resource_info), []).append(resource_info)
+        return [buckets[priority] for priority in sorted(buckets)]
     
-    def _get_timestamp(self) -> str:
-        """Get current timestamp for logging."""
-        from datetime import datetime
-        return datetime.utcnow().isoformat() + 'Z'
+    @staticmethod
+    def _get_timestamp() -> str:
+        """Get current UTC timestamp for logging."""
+        return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
 
 # Main execution functions for API integration
 async def upgrade_resource_automated(subscription_id: str, resource_id: str, 
@@ -14,10 +14,19 @@ Date: July 29, 2025
 """
 
 import asyncio
+import collections
+import copy
+import functools
 import logging
+import os
+import re
 from typing import Dict, List, Any, Optional, Tuple
 import json
+import random
 import time
+import weakref
+
+from .upgrade_batch import unique_resource_ids, upgrade_each_once
 
 # HTTP client for direct API calls
 try:
@@ -27,20 +36,29 @@ except ImportError:
     HTTPX_AVAILABLE = False
     httpx = None
 
+# HTTP/2 for httpx needs the optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Optional fast JSON parser for raw ARM reads
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
 # Optional Azure SDK imports - graceful fallback if not available
 try:
-    from azure.identity import DefaultAzureCredential
-    from azure.mgmt.network import NetworkManagementClient
     from azure.mgmt.network.models import PublicIPAddress, PublicIPAddressSku, PublicIPAddressSkuName, PublicIPAddressSkuTier
     AZURE_SDK_AVAILABLE = True
 except ImportError as e:
-    logging.warning(f"Azure SDK not available: {e}")
+    logging.warning("Azure SDK not available: %s", e)
     AZURE_SDK_AVAILABLE = False
     # Create dummy classes to prevent import errors
-    class DefaultAzureCredential:
-        pass
-    class NetworkManagementClient:
-        pass
     class PublicIPAddress:
         pass
     class PublicIPAddressSku:
@@ -50,10 +68,413 @@ except ImportError as e:
     class PublicIPAddressSkuTier:
         pass
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Optional async SDK clients - used for every SDK-path ARM call
+try:
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+    from azure.mgmt.core.polling.async_arm_polling import AsyncARMPolling
+    from azure.mgmt.network.aio import NetworkManagementClient as AsyncNetworkManagementClient
+    AZURE_AIO_AVAILABLE = True
+except ImportError:
+    AZURE_AIO_AVAILABLE = False
+    aiohttp = None
+    class AioHttpTransport:
+        pass
+    class AsyncDefaultAzureCredential:
+        pass
+    class AsyncARMPolling:
+        pass
+    class AsyncNetworkManagementClient:
+        pass
+
+# Decided once at import instead of on every agent construction / upgrade call
+SDK_CLIENTS_AVAILABLE = AZURE_SDK_AVAILABLE and AZURE_AIO_AVAILABLE
+
 logger = logging.getLogger(__name__)
 
+# Fewer, slower retries: under ARM throttling quick retries only burn the remaining budget
+ARM_RETRY_TOTAL = 3
+ARM_RETRY_BACKOFF_FACTOR = 4
+
+# Beyond ~30 concurrent ARM calls some requests stall for tens of seconds;
+# cap in-flight calls across every agent instance in the process (REST and SDK alike)
+MAX_CONCURRENT_ARM_CALLS = int(os.getenv("AZURE_ARM_CONCURRENCY", "15"))
+_ARM_SEM = asyncio.Semaphore(MAX_CONCURRENT_ARM_CALLS)
+
+async def _arm(coro):
+    """Await an ARM call while holding a slot of the shared concurrency limit."""
+    async with _ARM_SEM:
+        return await coro
+
+# Shared SDK clients: each call is awaited on aiohttp instead of occupying a worker
+# thread. One credential per process, one cached client per subscription, and all
+# clients on a single aiohttp session, so keep-alive connections and TLS sessions
+# are shared across subscriptions.
+_async_credential = None
+_async_network_clients: Dict[str, AsyncNetworkManagementClient] = {}
+_aiohttp_session = None
+
+def _get_sdk_transport() -> AioHttpTransport:
+    """Return a transport for one SDK client, backed by the process-wide aiohttp session."""
+    global _aiohttp_session
+    if _aiohttp_session is None:
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300)
+        )
+    # Not the session owner: closing one client must leave the shared pool open
+    return AioHttpTransport(session=_aiohttp_session, session_owner=False)
+
+def _get_async_credential() -> AsyncDefaultAzureCredential:
+    """Return the process-wide async credential, creating it on first use."""
+    global _async_credential
+    if _async_credential is None:
+        _async_credential = AsyncDefaultAzureCredential()
+    return _async_credential
+
+def _get_async_network_client(subscription_id: str) -> AsyncNetworkManagementClient:
+    """Return the cached async NetworkManagementClient for a subscription, creating it on first use."""
+    client = _async_network_clients.get(subscription_id)
+    if client is None:
+        client = AsyncNetworkManagementClient(
+            _get_async_credential(),
+            subscription_id,
+            transport=_get_sdk_transport(),
+            retry_total=ARM_RETRY_TOTAL,
+            retry_backoff_factor=ARM_RETRY_BACKOFF_FACTOR
+        )
+        _async_network_clients[subscription_id] = client
+    return client
+
+# ARM REST calls share one httpx client; calls made without a user token use a
+# bearer token from the shared credential, cached until shortly before it expires
+ARM_ENDPOINT = "https://management.azure.com"
+ARM_SCOPE = "https://management.azure.com/.default"
+NETWORK_API_VERSION = "2023-09-01"
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+_http_client = None
+_arm_token = None
+
+def _get_http_client() -> "httpx.AsyncClient":
+    """
+    Return the process-wide httpx client for ARM REST calls.
+    
+    Shared across agents and upgrades so requests reuse keep-alive connections (HTTP/2
+    multiplexes parallel requests on one). Auth headers are passed per request, since
+    HTTP-path upgrades each carry their own user token.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=100)
+        )
+    return _http_client
+
+async def _get_arm_auth_headers() -> Dict[str, str]:
+    """Return ARM auth headers, reusing the bearer token until shortly before it expires."""
+    global _arm_token
+    if _arm_token is None or _arm_token.expires_on - time.time() < TOKEN_REFRESH_MARGIN_SECONDS:
+        _arm_token = await _get_async_credential().get_token(ARM_SCOPE)
+    return {"Authorization": f"Bearer {_arm_token.token}"}
+
+# Verification polling backoff: exponential with jitter so concurrent upgrades don't poll in lockstep
+BACKOFF_INITIAL_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+# Overall budget for the SDK path's post-dissociation verification
+SDK_DISSOCIATION_VERIFY_TIMEOUT_SECONDS = 180
+
+def _backoff_delay(attempt: int, *responses: "httpx.Response") -> float:
+    """Seconds to wait before the next poll, deferring to Retry-After when ARM is throttling us."""
+    retry_after = [
+        float(response.headers["Retry-After"])
+        for response in responses
+        if response is not None and response.headers.get("Retry-After", "").isdigit()
+    ]
+    if retry_after:
+        return max(retry_after)
+    delay = min(BACKOFF_INITIAL_SECONDS * 2 ** attempt, BACKOFF_MAX_SECONDS)
+    return min(delay + random.uniform(0, BACKOFF_INITIAL_SECONDS), BACKOFF_MAX_SECONDS)
+
+def _loads(response: "httpx.Response") -> Dict[str, Any]:
+    return orjson.loads(response.content) if ORJSON_AVAILABLE else response.json()
+
+def _dumps(payload: Dict[str, Any]) -> bytes:
+    return orjson.dumps(payload) if ORJSON_AVAILABLE else json.dumps(payload).encode()
+
+# ARM /batch endpoint: many independent sub-requests share one round trip
+ARM_BATCH_API_VERSION = "2020-06-01"
+ARM_BATCH_MAX_REQUESTS = 500
+# Whole upgrades in flight at once in upgrade_public_ips; their ARM calls still share _ARM_SEM
+MAX_CONCURRENT_UPGRADES = 16
+
+async def _arm_batch_get(paths: List[str], headers: Dict[str, str],
+                         timeout: float = 120) -> List[Dict[str, Any]]:
+    """
+    GET many ARM resources through the /batch endpoint.
+    
+    Returns one {"httpStatusCode", "content"} entry per path, in the order given;
+    callers check each status code themselves. A batch ARM cannot answer at once
+    comes back 202 and is polled at its Location until the responses are ready,
+    for at most timeout seconds per chunk (then asyncio.TimeoutError is raised).
+    """
+    client = _get_http_client()
+    url = f"{ARM_ENDPOINT}/batch?api-version={ARM_BATCH_API_VERSION}"
+    results: List[Dict[str, Any]] = []
+    for start in range(0, len(paths), ARM_BATCH_MAX_REQUESTS):
+        chunk = paths[start:start + ARM_BATCH_MAX_REQUESTS]
+        body = {"requests": [
+            {"httpMethod": "GET", "url": f"{path}?api-version={NETWORK_API_VERSION}", "name": str(i)}
+            for i, path in enumerate(chunk)
+        ]}
+        response = await _arm(client.post(url, headers={**headers, "Content-Type": "application/json"},
+                                          content=_dumps(body)))
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while response.status_code == 202 and "Location" in response.headers:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"ARM batch still pending after {timeout:.0f}s")
+            await asyncio.sleep(min(_backoff_delay(attempt, response), remaining))
+            attempt += 1
+            response = await _arm(client.get(response.headers["Location"], headers=headers))
+        response.raise_for_status()
+        by_name = {entry.get("name"): entry for entry in _loads(response).get("responses", [])}
+        results.extend(by_name.get(str(i), {"httpStatusCode": 0, "content": None}) for i in range(len(chunk)))
+    return results
+
+async def close_shared_clients():
+    """Close the shared HTTP client and cached async SDK clients (call on application shutdown)."""
+    global _async_credential, _aiohttp_session, _http_client, _arm_token
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    _arm_token = None
+    for client in _async_network_clients.values():
+        await client.close()
+    _async_network_clients.clear()
+    if _aiohttp_session is not None:
+        await _aiohttp_session.close()
+        _aiohttp_session = None
+    if _async_credential is not None:
+        await _async_credential.close()
+        _async_credential = None
+
+def _nic_with_public_ip(nic: Dict[str, Any], config_name: str, public_ip_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Return the NIC body (as returned by ARM) with one IP configuration's Public IP changed.
+    
+    A PUT replaces the whole NIC and resets anything left out of the body, so every
+    other field is echoed back as fetched. public_ip_id None detaches the Public IP.
+    The fetched dict itself is left untouched.
+    """
+    ip_configurations = []
+    for ip_config in nic['properties'].get('ipConfigurations', []):
+        if ip_config['name'] == config_name:
+            properties = {key: value for key, value in ip_config['properties'].items() if key != 'publicIPAddress'}
+            if public_ip_id:
+                properties['publicIPAddress'] = {"id": public_ip_id}
+            ip_config = {**ip_config, "properties": properties}
+        ip_configurations.append(ip_config)
+    return {**nic, "properties": {**nic['properties'], "ipConfigurations": ip_configurations}}
+
+def _standard_sku_body(public_ip: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return the PUT body that moves a Public IP (as returned by ARM) to Standard SKU.
+    
+    A PUT resets anything left out of the body, so the fetched Public IP is echoed back
+    with only the SKU and allocation changed (Standard SKU requires Static allocation).
+    ipConfiguration is dropped: the Public IP is detached by then, and the association
+    is owned by the NIC. PATCH on publicIPAddresses only updates tags, so the upgrade
+    has to be a PUT.
+    """
+    properties = {key: value for key, value in public_ip.get("properties", {}).items() if key != "ipConfiguration"}
+    properties["publicIPAllocationMethod"] = "Static"
+    return {**public_ip, "sku": {"name": "Standard", "tier": "Regional"}, "properties": properties}
+
+# Public IPs recently seen on Standard SKU (lower-cased id -> when), so repeat requests
+# skip the GET entirely. A Public IP can't be downgraded in place, but it can be deleted
+# and recreated as Basic under the same id, so entries expire; past the size bound the
+# oldest are dropped first.
+STANDARD_SKU_CACHE_TTL_SECONDS = 900.0
+STANDARD_SKU_CACHE_MAX_ENTRIES = 10000
+_standard_public_ips: "collections.OrderedDict[str, float]" = collections.OrderedDict()
+
+def _is_known_standard(resource_id: str) -> bool:
+    """True if the Public IP was seen on Standard SKU within the TTL (expired entries are dropped)."""
+    key = resource_id.lower()
+    seen_at = _standard_public_ips.get(key)
+    if seen_at is None:
+        return False
+    if time.monotonic() - seen_at < STANDARD_SKU_CACHE_TTL_SECONDS:
+        return True
+    del _standard_public_ips[key]
+    return False
+
+def _remember_standard(resource_id: str) -> None:
+    key = resource_id.lower()
+    _standard_public_ips[key] = time.monotonic()
+    _standard_public_ips.move_to_end(key)
+    while len(_standard_public_ips) > STANDARD_SKU_CACHE_MAX_ENTRIES:
+        _standard_public_ips.popitem(last=False)
+
+# SKU upgrades still running in Azure, by lower-cased Public IP id. An upgrade retried
+# after its caller gave up on the wait resumes polling the existing LRO instead of
+# issuing a second PUT, and restores the NIC attachments the first attempt removed.
+# Process-local: the app has no durable store.
+class _PendingSkuUpgrade(collections.namedtuple('_PendingSkuUpgrade', 'continuation_token attachments')):
+    """Continuation token of an SKU upgrade LRO, plus the attachments to restore after it."""
+    __slots__ = ()
+
+_pending_sku_upgrades: Dict[str, _PendingSkuUpgrade] = {}
+
+# Public IPs on the same NIC are upgraded concurrently, and a NIC PUT sends back the whole
+# NIC as read: each NIC GET -> PUT holds that NIC's lock, until ARM has applied the PUT,
+# so one upgrade cannot overwrite another's change. Weak values drop a NIC's lock once no
+# upgrade is using it.
+_nic_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def _nic_lock(nic_id: str) -> asyncio.Lock:
+    key = nic_id.lower()
+    lock = _nic_locks.get(key)
+    if lock is None:
+        lock = _nic_locks[key] = asyncio.Lock()
+    return lock
+
+def _sdk_nic_id(subscription_id: str, resource_group: str, nic_name: str) -> str:
+    return (f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}"
+            f"/providers/Microsoft.Network/networkInterfaces/{nic_name}")
+RESOURCE_GRAPH_API_VERSION = "2021-03-01"
+RESOURCE_GRAPH_PAGE_SIZE = 1000
+
+_STANDARD_PUBLIC_IPS_QUERY = """
+resources
+| where type =~ 'microsoft.network/publicipaddresses'
+| where id in~ ({ids})
+| where sku.name =~ 'Standard'
+| project id
+"""
+
+# Network LROs often answer with Retry-After of 10-20s even when the operation
+# finishes in about a second; cap the delay so completion is noticed promptly
+MAX_LRO_POLL_DELAY = 1.0
+
+class _CappedDelayMixin:
+    """Never wait longer than MAX_LRO_POLL_DELAY between polls."""
+    
+    def _extract_delay(self):
+        delay = super()._extract_delay()
+        return min(delay, MAX_LRO_POLL_DELAY) if delay else delay
+
+class _FastAsyncARMPolling(_CappedDelayMixin, AsyncARMPolling):
+    """AsyncARMPolling with a capped delay between polls."""
+
+def _fast_async_polling() -> AsyncARMPolling:
+    """Create a polling method for one LRO (polling methods hold per-operation state)."""
+    return _FastAsyncARMPolling(MAX_LRO_POLL_DELAY)
+
+# Upper bounds on waiting for an LRO: NIC/LB updates are quick, SKU changes slower
+NIC_UPDATE_TIMEOUT_SECONDS = 180
+SKU_UPGRADE_TIMEOUT_SECONDS = 300
+
+async def _lro_result(poller, timeout: float):
+    """
+    Await an async LRO's final resource, giving up after timeout seconds.
+    
+    No _ARM_SEM slot is held while waiting: the poller spends nearly all of that time
+    sleeping between polls, and a minutes-long LRO would otherwise starve other calls.
+    """
+    return await asyncio.wait_for(poller.result(), timeout)
+
+# Any resource or child resource ID, e.g. .../networkInterfaces/{nic}/ipConfigurations/{config}
+_ANY_RID_RE = re.compile(
+    r"^/subscriptions/(?P<sub>[^/]+)/resourceGroups/(?P<rg>[^/]+)/providers/(?P<provider>[^/]+)"
+    r"/(?P<type>[^/]+)/(?P<name>[^/]+)(?:/(?P<child_type>[^/]+)/(?P<child_name>[^/]+))?/?$",
+    re.IGNORECASE
+)
+
+class ResourceId(collections.namedtuple('ResourceId', 'sub rg provider type name parent_type parent_name')):
+    """Parsed resource ID; parent_type/parent_name are set for child resources only."""
+    __slots__ = ()
+    
+    def parent_id(self) -> Optional[str]:
+        """ID of the parent resource (e.g. the NIC of an ipConfiguration), or None for top-level ids."""
+        if not self.parent_type:
+            return None
+        return (f"/subscriptions/{self.sub}/resourceGroups/{self.rg}"
+                f"/providers/{self.provider}/{self.parent_type}/{self.parent_name}")
+
+@functools.lru_cache(maxsize=1024)
+def _parse_any_id(resource_id: str) -> Optional[ResourceId]:
+    """Parse a resource or child resource ID once, so callers never re-split it."""
+    match = _ANY_RID_RE.match(resource_id)
+    if not match:
+        return None
+    if match['child_type']:
+        return ResourceId(match['sub'], match['rg'], match['provider'],
+                          match['child_type'], match['child_name'], match['type'], match['name'])
+    return ResourceId(match['sub'], match['rg'], match['provider'], match['type'], match['name'], None, None)
+
+# Manual Public IP upgrade instructions; {resource_name} in step 2 is filled in per resource.
+# Each result gets its own deep copy, so callers may modify what they are given.
+_MANUAL_UPGRADE_INSTRUCTIONS = {
+    "title": "Public IP Address Upgrade (Basic to Standard SKU)",
+    "estimated_time": "5-10 minutes",
+    "resource_name": None,
+    "prerequisites": [
+        "Ensure the Public IP is not currently in use",
+        "Verify you have Network Contributor permissions",
+        "Consider maintenance window if IP is critical"
+    ],
+    "steps": [
+        {
+            "step": 1,
+            "action": "Navigate to Azure Portal",
+            "details": "Open Azure Portal (portal.azure.com) and search for 'Public IP addresses'"
+        },
+        {
+            "step": 2,
+            "action": "Locate and select your Public IP",
+            "details": "Find and click on the Public IP resource: {resource_name}"
+        },
+        {
+            "step": 3,
+            "action": "Check current associations",
+            "details": "In the Overview tab, note any associated resources (VMs, Load Balancers, etc.)"
+        },
+        {
+            "step": 4,
+            "action": "Dissociate if needed",
+            "details": "If associated with resources, dissociate them first (will cause temporary downtime)"
+        },
+        {
+            "step": 5,
+            "action": "Upgrade SKU",
+            "details": "Go to Configuration tab → Change SKU from Basic to Standard → Save"
+        },
+        {
+            "step": 6,
+            "action": "Re-associate resources",
+            "details": "Re-associate with the original resources to restore connectivity"
+        }
+    ],
+    "warnings": [
+        "⚠️  This upgrade will cause temporary downtime while dissociated",
+        "⚠️  Standard SKU Public IPs have different pricing",
+        "⚠️  Some legacy configurations may not be compatible"
+    ],
+    "post_upgrade": [
+        "Verify connectivity to associated resources",
+        "Test any applications that depend on this IP",
+        "Update DNS records if the IP address changed"
+    ]
+}
+
+def _find_ip_configuration(nic, config_name: str):
+    """Return the NIC model's IP configuration with the given name, or None."""
+    return next((ip_config for ip_config in nic.ip_configurations or [] if ip_config.name == config_name), None)
+
 class PublicIPUpgradeAgent:
     """
     Automated agent for upgrading Public IP addresses from Basic to Standard SKU.
@@ -65,26 +486,19 @@ class PublicIPUpgradeAgent:
         self.subscription_id = subscription_id
         self.access_token = access_token
         self.tenant_id = tenant_id
-        self.sdk_available = AZURE_SDK_AVAILABLE
+        self.credential = None
+        self.network_client = None
         
         # If we have access token, use HTTP calls (preferred)
         if access_token and HTTPX_AVAILABLE:
-            self.credential = None
-            self.network_client = None
             logger.info("🔑 PublicIP Agent using user access token for authentication")
+        # Otherwise use the SDK with the process-wide credential, so its token cache is shared
+        elif SDK_CLIENTS_AVAILABLE:
+            self.network_client = _get_async_network_client(subscription_id)
+            self.credential = _get_async_credential()
+            logger.info("🔑 PublicIP Agent using DefaultAzureCredential for authentication")
         else:
-            # Try Azure SDK as fallback
-            try:
-                if self.sdk_available:
-                    self.credential = DefaultAzureCredential()
-                    self.network_client = NetworkManagementClient(self.credential, subscription_id)
-                    logger.info("🔑 PublicIP Agent using DefaultAzureCredential for authentication")
-                else:
-                    raise Exception("Azure SDK not available")
-            except Exception as e:
-                logger.warning(f"⚠️ PublicIP Agent Azure SDK authentication failed: {e}")
-                self.credential = None
-                self.network_client = None
+            logger.warning("⚠️ PublicIP Agent: Azure SDK not available")
         
     async def upgrade_public_ip(self, resource_id: str) -> Dict[str, Any]:
         """
@@ -96,11 +510,16 @@ class PublicIPUpgradeAgent:
         Returns:
             Dict containing upgrade results and details
         """
-        logger.info(f"🚀 Starting Public IP upgrade: {resource_id}")
+        logger.info("🚀 Starting Public IP upgrade: %s", resource_id)
+        
+        # A pending SKU upgrade still has attachments to restore, whatever the SKU now is
+        if _is_known_standard(resource_id) and resource_id.lower() not in _pending_sku_upgrades:
+            logger.info("📊 Public IP already known to be Standard SKU - nothing to do")
+            return self._already_standard_result()
         
         try:
             # Prioritize Azure SDK approach for better dissociation handling
-            if self.sdk_available and self.network_client:
+            if self.network_client:
                 logger.info("🔧 Using Azure SDK approach (primary method)")
                 return await self._upgrade_via_sdk(resource_id)
             
@@ -120,13 +539,101 @@ class PublicIPUpgradeAgent:
                 }
                 
         except Exception as e:
-            logger.error(f"❌ Public IP upgrade failed: {str(e)}")
+            logger.error("❌ Public IP upgrade failed: %s", e)
             return {
                 "success": False,
                 "error": f"Upgrade process failed: {str(e)}",
                 "resource_id": resource_id
             }
     
+    @staticmethod
+    def _already_standard_result() -> Dict[str, Any]:
+        return {
+            "success": True,
+            "message": "Public IP is already using Standard SKU",
+            "sku_before": "Standard",
+            "sku_after": "Standard",
+            "no_change_required": True
+        }
+    
+    @staticmethod
+    def _sku_upgrade_pending_result(resource_id: str, attachments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        detached = ", ".join(f"{a['nic_name']}/{a['config_name']}" for a in attachments)
+        return {
+            "success": False,
+            "error": f"SKU upgrade did not complete within {SKU_UPGRADE_TIMEOUT_SECONDS}s",
+            "message": ("The SKU upgrade is still running in Azure. Retry the upgrade to resume it"
+                        + (f" and re-associate the Public IP with {detached}" if detached else "") + "."),
+            "resource_id": resource_id,
+            "upgrade_method": "enhanced_azure_sdk",
+            "manual_action_required": True
+        }
+    
+    async def prime_sku_cache(self, resource_ids: List[str]) -> int:
+        """
+        Record which of many Public IPs are already Standard SKU with Resource Graph queries.
+        
+        Meant for bulk sweeps: later upgrade_public_ip calls for those ids return without
+        touching the resource. Returns the number of ids found on Standard SKU (0 when
+        there is no way to call ARM).
+        """
+        pending = [rid for rid in dict.fromkeys(r.lower() for r in resource_ids) if not _is_known_standard(rid)]
+        if not pending or not (HTTPX_AVAILABLE and (self.access_token or SDK_CLIENTS_AVAILABLE)):
+            return 0
+        
+        if self.access_token:
+            headers = {"Authorization": f"Bearer {self.access_token}"}
+        else:
+            headers = await _get_arm_auth_headers()
+        parsed_ids = [_parse_any_id(rid) for rid in pending]
+        subscriptions = sorted({parsed.sub for parsed in parsed_ids if parsed})
+        url = f"{ARM_ENDPOINT}/providers/Microsoft.ResourceGraph/resources?api-version={RESOURCE_GRAPH_API_VERSION}"
+        
+        found = 0
+        for start in range(0, len(pending), RESOURCE_GRAPH_PAGE_SIZE):
+            batch = pending[start:start + RESOURCE_GRAPH_PAGE_SIZE]
+            query = _STANDARD_PUBLIC_IPS_QUERY.format(ids=", ".join(f"'{rid}'" for rid in batch))
+            response = await _arm(_get_http_client().post(
+                url, headers={**headers, "Content-Type": "application/json"},
+                content=_dumps({"subscriptions": subscriptions, "query": query,
+                                "options": {"$top": RESOURCE_GRAPH_PAGE_SIZE}})
+            ))
+            response.raise_for_status()
+            for row in _loads(response).get("data", []):
+                _remember_standard(row["id"])
+                found += 1
+        
+        logger.info("📊 SKU cache primed: %s of %s Public IPs already Standard", found, len(pending))
+        return found
+    
+    async def upgrade_public_ips(self, resource_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Upgrade many Public IPs, returning one result per id in the order given.
+        
+        The SKU checks go out as a single ARM /batch request, so ids already on
+        Standard SKU cost no round trip of their own; the remaining upgrades run
+        concurrently, at most MAX_CONCURRENT_UPGRADES at a time. An id given more than
+        once (ARM ids are case-insensitive) is upgraded once and its result repeated.
+        """
+        # One upgrade per Public IP: two at once would race their NIC and SKU PUTs
+        pending = [rid for rid in unique_resource_ids(resource_ids) if not _is_known_standard(rid)]
+        if pending and HTTPX_AVAILABLE and (self.access_token or SDK_CLIENTS_AVAILABLE):
+            if self.access_token:
+                headers = {"Authorization": f"Bearer {self.access_token}"}
+            else:
+                headers = await _get_arm_auth_headers()
+            try:
+                for rid, entry in zip(pending, await _arm_batch_get(pending, headers)):
+                    if entry.get("httpStatusCode") == 200:
+                        sku = ((entry.get("content") or {}).get("sku") or {}).get("name", "")
+                        if sku.lower() == "standard":
+                            _remember_standard(rid)
+            except Exception as e:
+                # Only an optimization: each upgrade still reads its Public IP before changing it
+                logger.warning("⚠️ Batched SKU check failed, checking Public IPs one by one: %s", e)
+        
+        return await upgrade_each_once(resource_ids, self.upgrade_public_ip, MAX_CONCURRENT_UPGRADES)
+    
     async def _upgrade_via_http(self, resource_id: str) -> Dict[str, Any]:
         """Upgrade Public IP using HTTP API calls with access token."""
         try:
@@ -141,156 +648,150 @@ class PublicIPUpgradeAgent:
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient(timeout=60) as client:
-                # Get current configuration
-                response = await client.get(url, headers=headers)
-                if response.status_code != 200:
-                    return {
-                        "success": False,
-                        "error": f"Failed to retrieve Public IP: {response.status_code}",
-                        "message": f"Could not access Public IP resource: {response.text}"
-                    }
-                
-                current_config = response.json()
-                current_sku = current_config.get("sku", {}).get("name", "").lower()
-                
-                logger.info(f"📊 Current SKU: {current_sku}")
-                
-                # Check if already Standard
-                if current_sku == "standard":
-                    return {
-                        "success": True,
-                        "message": "Public IP is already using Standard SKU",
-                        "sku_before": "Standard",
-                        "sku_after": "Standard",
-                        "no_change_required": True
-                    }
+            # Shared client: every GET/PUT/verification poll reuses pooled keep-alive connections
+            client = _get_http_client()
+            
+            # Get current configuration
+            response = await _arm(client.get(url, headers=headers))
+            if response.status_code != 200:
+                return {
+                    "success": False,
+                    "error": f"Failed to retrieve Public IP: {response.status_code}",
+                    "message": f"Could not access Public IP resource: {response.text}"
+                }
+            
+            current_config = _loads(response)
+            current_sku = current_config.get("sku", {}).get("name", "").lower()
+            
+            logger.info("📊 Current SKU: %s", current_sku)
+            
+            # Check if already Standard
+            if current_sku == "standard":
+                _remember_standard(resource_id)
+                return self._already_standard_result()
+            
+            # Step 2: Check if Public IP is attached to any resources
+            attached_resource = None
+            ip_configuration = current_config.get("properties", {}).get("ipConfiguration")
+            
+            if ip_configuration:
+                logger.info("🔗 Step 2: Public IP is attached to a resource - dissociating...")
+                attached_resource = ip_configuration.get("id")
                 
-                # Step 2: Check if Public IP is attached to any resources
-                attached_resource = None
-                ip_configuration = current_config.get("properties", {}).get("ipConfiguration")
+                # Step 3 overlaps the tail of the dissociation: the SKU PUT goes out as soon as
+                # the Public IP reports itself free, while the NIC side is still being verified.
+                # A Public IP has a single ipConfiguration, so there is only one NIC to wait for.
+                public_ip_free = asyncio.Event()
+                sku_task = asyncio.create_task(
+                    self._put_standard_sku_http(url, client, headers, current_config, ready=public_ip_free)
+                )
                 
-                if ip_configuration:
-                    logger.info("🔗 Step 2: Public IP is attached to a resource - dissociating...")
-                    attached_resource = ip_configuration.get("id")
-                    
+                try:
                     # Dissociate from the attached resource
-                    dissociation_result = await self._dissociate_public_ip_http(attached_resource, url, client, headers)
+                    dissociation_result = await self._dissociate_public_ip_http(
+                        attached_resource, url, client, headers, public_ip_etag=current_config.get("etag"),
+                        public_ip_free=public_ip_free
+                    )
                     if not dissociation_result["success"]:
-                        return dissociation_result
-                    
-                    # Enhanced verification with multiple checks
-                    logger.info("🔍 Enhanced verification: Ensuring complete dissociation...")
-                    
-                    # Wait longer for Azure to process the changes
-                    import asyncio
-                    await asyncio.sleep(5)
-                    
-                    # Multiple verification attempts with exponential backoff
-                    max_verification_attempts = 10
-                    for attempt in range(max_verification_attempts):
-                        logger.info(f"🔍 Verification attempt {attempt + 1}/{max_verification_attempts}")
-                        
-                        verify_response = await client.get(url, headers=headers)
-                        if verify_response.status_code == 200:
-                            verify_config = verify_response.json()
-                            ip_config_ref = verify_config.get("properties", {}).get("ipConfiguration")
-                            
-                            if not ip_config_ref:
-                                logger.info("✅ Dissociation verified successfully")
-                                break
-                            else:
-                                wait_time = min(2 ** attempt, 30)  # Exponential backoff, max 30 seconds
-                                logger.info(f"⏳ Still attached, waiting {wait_time}s before retry...")
-                                await asyncio.sleep(wait_time)
-                        else:
-                            logger.warning(f"⚠️ Verification request failed: {verify_response.status_code}")
-                            await asyncio.sleep(2)
-                    
-                    # Final verification
-                    final_verify = await client.get(url, headers=headers)
-                    if final_verify.status_code == 200:
-                        final_config = final_verify.json()
-                        if final_config.get("properties", {}).get("ipConfiguration"):
-                            return {
-                                "success": False, 
-                                "error": "PublicIPStillAttached",
-                                "message": "Failed to fully dissociate Public IP after multiple attempts. The resource may be in use by another service."
-                            }
-                        
-                else:
-                    logger.info("🔗 Step 2: Public IP is not attached to any resources")
-                
-                # Step 3: Update to Standard SKU
-                logger.info("🔄 Step 3: Updating SKU from Basic to Standard...")
-                
-                # Create updated configuration
-                updated_config = current_config.copy()
-                updated_config["sku"] = {
-                    "name": "Standard",
-                    "tier": "Regional"
-                }
-                
-                # Ensure allocation method is Static for Standard SKU
-                if "properties" not in updated_config:
-                    updated_config["properties"] = {}
-                updated_config["properties"]["publicIPAllocationMethod"] = "Static"
-                
-                # Remove the ipConfiguration since we dissociated it
-                if "ipConfiguration" in updated_config.get("properties", {}):
-                    del updated_config["properties"]["ipConfiguration"]
-                
-                # Update the Public IP
-                update_response = await client.put(url, headers=headers, json=updated_config)
-                
-                if update_response.status_code in [200, 201, 202]:
-                    logger.info("✅ Public IP SKU upgraded successfully!")
-                    
-                    # Step 4: Re-associate with the resource if it was attached
-                    if attached_resource:
-                        logger.info("🔗 Step 4: Re-associating Public IP with resource...")
-                        reassociation_result = await self._reassociate_public_ip_http(
-                            attached_resource, resource_id, client, headers
-                        )
-                        if not reassociation_result["success"]:
-                            return {
-                                "success": False,
-                                "error": "Upgrade succeeded but re-association failed",
-                                "message": f"Public IP upgraded but failed to re-associate: {reassociation_result['message']}",
-                                "manual_action_required": True
-                            }
+                        if not public_ip_free.is_set():
+                            if dissociation_result.get("nic_updated"):
+                                # The NIC no longer points at the Public IP; put it back rather
+                                # than leave the NIC without its address
+                                logger.warning("⚠️ Dissociation not verified, restoring the association...")
+                                restore_result = await self._reassociate_public_ip_http(
+                                    attached_resource, resource_id, client, headers
+                                )
+                                if not restore_result["success"]:
+                                    return {
+                                        **dissociation_result,
+                                        "message": (f"{dissociation_result['message']} Restoring the association "
+                                                    f"also failed: {restore_result['message']}"),
+                                        "manual_action_required": True
+                                    }
+                            return dissociation_result
+                        # The Public IP is free and its SKU PUT is already out, so see the upgrade through
+                        logger.warning("⚠️ NIC verification incomplete but Public IP is free: %s", dissociation_result['message'])
+                    else:
+                        # _dissociate_public_ip_http only succeeds once its own polling has confirmed
+                        # both the Public IP and the NIC are clean - no second verification round here
+                        logger.info("✅ Dissociation verified")
+                    update_response = await sku_task
+                finally:
+                    # On any early exit (a failed dissociation, an error, or this upgrade being
+                    # cancelled) the task would otherwise wait forever for public_ip_free
+                    if not sku_task.done():
+                        sku_task.cancel()
                     
-                    return {
-                        "success": True,
-                        "message": "Public IP successfully upgraded from Basic to Standard SKU",
-                        "sku_before": "Basic",
-                        "sku_after": "Standard", 
-                        "resource_id": resource_id,
-                        "upgrade_method": "http_api",
-                        "allocation_method": "Static",
-                        "attached_resource": attached_resource,
-                        "details": {
-                            "upgrade_completed": True,
-                            "downtime_minimal": True,
-                            "configuration_preserved": True,
-                            "dissociation_performed": attached_resource is not None,
-                            "reassociation_performed": attached_resource is not None
-                        }
-                    }
-                else:
-                    # If upgrade failed and we dissociated, try to reassociate
+            else:
+                logger.info("🔗 Step 2: Public IP is not attached to any resources")
+                update_response = await self._put_standard_sku_http(url, client, headers, current_config)
+            
+            if update_response.status_code in [200, 201, 202]:
+                # A 201/202 only means ARM accepted the PUT; see the operation through before
+                # treating the Public IP as Standard
+                operation_error = await self._wait_for_async_operation(client, headers, update_response)
+                if operation_error:
                     if attached_resource:
-                        logger.warning("⚠️ Upgrade failed, attempting to restore association...")
+                        logger.warning("⚠️ Upgrade did not complete, attempting to restore association...")
                         await self._reassociate_public_ip_http(attached_resource, resource_id, client, headers)
-                    
                     return {
                         "success": False,
-                        "error": f"Upgrade failed: {update_response.status_code}",
-                        "message": f"Failed to update Public IP: {update_response.text}"
+                        "error": f"Upgrade did not complete: {operation_error}",
+                        "message": f"Public IP SKU update did not complete: {operation_error}"
                     }
-                    
+                
+                logger.info("✅ Public IP SKU upgraded successfully!")
+                # Cache only a confirmed upgrade: a polled operation, or a completed PUT showing Standard
+                operation_polled = any(name in update_response.headers for name in ("Azure-AsyncOperation", "Location"))
+                if operation_polled or (update_response.status_code != 202
+                                        and _loads(update_response).get("sku", {}).get("name") == "Standard"):
+                    _remember_standard(resource_id)
+                
+                # Step 4: Re-associate with the resource if it was attached
+                if attached_resource:
+                    logger.info("🔗 Step 4: Re-associating Public IP with resource...")
+                    reassociation_result = await self._reassociate_public_ip_http(
+                        attached_resource, resource_id, client, headers
+                    )
+                    if not reassociation_result["success"]:
+                        return {
+                            "success": False,
+                            "error": "Upgrade succeeded but re-association failed",
+                            "message": f"Public IP upgraded but failed to re-associate: {reassociation_result['message']}",
+                            "manual_action_required": True
+                        }
+                
+                return {
+                    "success": True,
+                    "message": "Public IP successfully upgraded from Basic to Standard SKU",
+                    "sku_before": "Basic",
+                    "sku_after": "Standard", 
+                    "resource_id": resource_id,
+                    "upgrade_method": "http_api",
+                    "allocation_method": "Static",
+                    "attached_resource": attached_resource,
+                    "details": {
+                        "upgrade_completed": True,
+                        "downtime_minimal": True,
+                        "configuration_preserved": True,
+                        "dissociation_performed": attached_resource is not None,
+                        "reassociation_performed": attached_resource is not None
+                    }
+                }
+            else:
+                # If upgrade failed and we dissociated, try to reassociate
+                if attached_resource:
+                    logger.warning("⚠️ Upgrade failed, attempting to restore association...")
+                    await self._reassociate_public_ip_http(attached_resource, resource_id, client, headers)
+                
+                return {
+                    "success": False,
+                    "error": f"Upgrade failed: {update_response.status_code}",
+                    "message": f"Failed to update Public IP: {update_response.text}"
+                }
+                
         except Exception as e:
-            logger.error(f"❌ HTTP-based upgrade failed: {str(e)}")
+            logger.error("❌ HTTP-based upgrade failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -308,117 +809,154 @@ class PublicIPUpgradeAgent:
         4. Reassociate to original resources
         """
         try:
-            from azure.identity import DefaultAzureCredential
-            from azure.mgmt.network import NetworkManagementClient
-            from azure.mgmt.network.models import PublicIPAddressSku, PublicIPAddressSkuName, PublicIPAddressSkuTier
-            import asyncio
-            
             logger.info("🔧 Using Enhanced Azure SDK approach for Public IP upgrade")
             
             # Parse resource ID to extract components
-            parts = resource_id.split("/")
-            subscription_id = parts[2]
-            resource_group = parts[4]
-            public_ip_name = parts[8]
+            rid = _parse_any_id(resource_id)
+            if not rid:
+                raise ValueError(f"Invalid Public IP resource ID: {resource_id}")
+            subscription_id, resource_group, public_ip_name = rid.sub, rid.rg, rid.name
             
-            logger.info(f"📋 Subscription: {subscription_id}")
-            logger.info(f"📋 Resource Group: {resource_group}")
-            logger.info(f"📋 Public IP Name: {public_ip_name}")
+            logger.info("📋 Subscription: %s", subscription_id)
+            logger.info("📋 Resource Group: %s", resource_group)
+            logger.info("📋 Public IP Name: %s", public_ip_name)
             
-            # Initialize Azure SDK client with retry configuration
-            credential = DefaultAzureCredential()
-            network_client = NetworkManagementClient(credential, subscription_id)
+            # Reuse the shared async client (and its aiohttp pool) for this subscription
+            network_client = _get_async_network_client(subscription_id)
             
             # Step 1: Get current Public IP configuration
             logger.info("📊 Step 1: Getting current Public IP configuration...")
-            public_ip = network_client.public_ip_addresses.get(resource_group, public_ip_name)
+            public_ip = await _arm(network_client.public_ip_addresses.get(resource_group, public_ip_name))
             
-            logger.info(f"📊 Current SKU: {public_ip.sku.name}")
-            logger.info(f"📊 Current Allocation: {public_ip.public_ip_allocation_method}")
+            logger.info("📊 Current SKU: %s", public_ip.sku.name)
+            logger.info("📊 Current Allocation: %s", public_ip.public_ip_allocation_method)
             
-            # Check if already Standard
-            if public_ip.sku.name and public_ip.sku.name.lower() == "standard":
-                return {
-                    "success": True,
-                    "message": "Public IP is already using Standard SKU",
-                    "sku_before": "Standard",
-                    "sku_after": "Standard",
-                    "no_change_required": True
-                }
+            # An earlier attempt may have stopped waiting on its SKU upgrade after detaching
+            # the NIC; its continuation token and attachments let this attempt finish the job
+            pending_key = resource_id.lower()
+            pending_upgrade = _pending_sku_upgrades.get(pending_key)
             
-            # Step 2: Enhanced dissociation with proper verification
-            attached_resources = []
+            # Check if already Standard
+            is_standard = bool(public_ip.sku.name) and public_ip.sku.name.lower() == "standard"
+            if is_standard and not pending_upgrade:
+                _remember_standard(resource_id)
+                return self._already_standard_result()
             
-            if public_ip.ip_configuration:
-                logger.info("🔗 Step 2: Public IP is attached - performing enhanced dissociation...")
+            if pending_upgrade:
+                # The Public IP was detached by the earlier attempt, so restore its attachments
+                attached_resources = list(pending_upgrade.attachments)
+                if is_standard:
+                    logger.info("✅ SKU upgrade from an earlier attempt has completed")
+                    upgraded_public_ip = public_ip
+                else:
+                    logger.info("🚀 Resuming SKU upgrade already in progress...")
+                    upgrade_poller = await _arm(network_client.public_ip_addresses.begin_create_or_update(
+                        resource_group, public_ip_name, None,
+                        continuation_token=pending_upgrade.continuation_token,
+                        polling=_fast_async_polling()
+                    ))
+                    upgraded_public_ip = None
+            else:
+                # Step 2: Enhanced dissociation with proper verification
+                attached_resources = []
+                
+                if public_ip.ip_configuration:
+                    logger.info("🔗 Step 2: Public IP is attached - performing enhanced dissociation...")
+                    
+                    # Store all attachment details for later reassociation
+                    ip_config_id = public_ip.ip_configuration.id
+                    ip_config_rid = _parse_any_id(ip_config_id)
+                    nic_name = ip_config_rid.parent_name  # network interface name
+                    config_name = ip_config_rid.name  # IP configuration name
+                    
+                    logger.info("🔌 Attached to NIC: %s, Config: %s", nic_name, config_name)
+                    
+                    # Store attachment info for reassociation
+                    attached_resources.append({
+                        "type": "network_interface",
+                        "nic_name": nic_name,
+                        "config_name": config_name,
+                        "resource_group": resource_group,
+                        "public_ip_id": public_ip.id
+                    })
+                    
+                    # Perform complete dissociation; its verification hands back the freed Public IP
+                    fresh_public_ip = await self._perform_complete_dissociation(
+                        network_client, resource_group, nic_name, config_name, public_ip_name
+                    )
+                    
+                else:
+                    logger.info("🔗 Step 2: Public IP is not attached - proceeding with upgrade")
+                    # Nothing has changed since Step 1, so that read is still current
+                    fresh_public_ip = public_ip
                 
-                # Store all attachment details for later reassociation
-                ip_config_id = public_ip.ip_configuration.id
-                nic_parts = ip_config_id.split("/")
-                nic_name = nic_parts[8]  # network interface name
-                config_name = nic_parts[10]  # IP configuration name
+                # Step 3: Enhanced SKU upgrade with proper resource handling
+                logger.info("🔄 Step 3: Performing enhanced SKU upgrade...")
                 
-                logger.info(f"🔌 Attached to NIC: {nic_name}, Config: {config_name}")
+                # Re-read only if dissociation ended without a fresh view of the Public IP
+                if fresh_public_ip is None:
+                    fresh_public_ip = await _arm(network_client.public_ip_addresses.get(resource_group, public_ip_name))
                 
-                # Store attachment info for reassociation
-                attached_resources.append({
-                    "type": "network_interface",
-                    "nic_name": nic_name,
-                    "config_name": config_name,
-                    "resource_group": resource_group
-                })
+                # Verify it's completely dissociated before upgrade
+                if fresh_public_ip.ip_configuration:
+                    raise Exception("Public IP is still attached after dissociation - cannot proceed with upgrade")
                 
-                # Perform complete dissociation
-                await self._perform_complete_dissociation(
-                    network_client, resource_group, nic_name, config_name, public_ip_name
+                # Create proper SKU object for Standard
+                fresh_public_ip.sku = PublicIPAddressSku(
+                    name=PublicIPAddressSkuName.STANDARD,
+                    tier=PublicIPAddressSkuTier.REGIONAL
                 )
                 
-            else:
-                logger.info("🔗 Step 2: Public IP is not attached - proceeding with upgrade")
-            
-            # Step 3: Enhanced SKU upgrade with proper resource handling
-            logger.info("🔄 Step 3: Performing enhanced SKU upgrade...")
-            
-            # Get fresh Public IP reference after dissociation
-            fresh_public_ip = network_client.public_ip_addresses.get(resource_group, public_ip_name)
-            
-            # Verify it's completely dissociated before upgrade
-            if fresh_public_ip.ip_configuration:
-                raise Exception("Public IP is still attached after dissociation - cannot proceed with upgrade")
-            
-            # Create proper SKU object for Standard
-            fresh_public_ip.sku = PublicIPAddressSku(
-                name=PublicIPAddressSkuName.STANDARD,
-                tier=PublicIPAddressSkuTier.REGIONAL
-            )
-            
-            # Ensure Static allocation for Standard SKU
-            fresh_public_ip.public_ip_allocation_method = "Static"
-            
-            # Perform the upgrade with proper error handling
-            logger.info("🚀 Executing SKU upgrade to Standard...")
-            upgrade_poller = network_client.public_ip_addresses.begin_create_or_update(
-                resource_group, public_ip_name, fresh_public_ip
-            )
+                # Ensure Static allocation for Standard SKU
+                fresh_public_ip.public_ip_allocation_method = "Static"
+                
+                # Perform the upgrade with proper error handling
+                logger.info("🚀 Executing SKU upgrade to Standard...")
+                upgrade_poller = await _arm(network_client.public_ip_addresses.begin_create_or_update(
+                    resource_group, public_ip_name, fresh_public_ip,
+                    polling=_fast_async_polling()
+                ))
+                _pending_sku_upgrades[pending_key] = _PendingSkuUpgrade(
+                    upgrade_poller.continuation_token(), attached_resources
+                )
+                upgraded_public_ip = None
             
-            # Wait for upgrade with timeout
-            logger.info("⏳ Waiting for SKU upgrade to complete...")
-            upgrade_result = upgrade_poller.result(timeout=300)  # 5 minute timeout
+            if upgraded_public_ip is None:
+                # Wait for upgrade with timeout
+                logger.info("⏳ Waiting for SKU upgrade to complete...")
+                try:
+                    upgraded_public_ip = await _lro_result(upgrade_poller, SKU_UPGRADE_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Still running in Azure - keep the token so a retry picks the LRO back up
+                    logger.warning("⚠️ SKU upgrade still running after %ss", SKU_UPGRADE_TIMEOUT_SECONDS)
+                    return self._sku_upgrade_pending_result(resource_id, attached_resources)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    _pending_sku_upgrades.pop(pending_key, None)
+                    raise
+            _pending_sku_upgrades.pop(pending_key, None)
             logger.info("✅ SKU upgrade completed successfully")
             
-            # Verify the upgrade was successful
-            upgraded_public_ip = network_client.public_ip_addresses.get(resource_group, public_ip_name)
+            # Verify the upgrade was successful - the LRO result is the Public IP as ARM stored it
             if upgraded_public_ip.sku.name.lower() != "standard":
                 raise Exception(f"SKU upgrade failed - still shows {upgraded_public_ip.sku.name}")
+            _remember_standard(resource_id)
             
             # Step 4: Reassociate to original resources
             if attached_resources:
                 logger.info("🔄 Step 4: Reassociating Public IP to original resources...")
                 
-                for attachment in attached_resources:
-                    await self._perform_reassociation(
-                        network_client, attachment, resource_group, public_ip_name
-                    )
+                # Attachments are independent, so reassociate them all at once
+                results = await asyncio.gather(
+                    *(self._perform_reassociation(network_client, attachment, resource_group, public_ip_name)
+                      for attachment in attached_resources),
+                    return_exceptions=True
+                )
+                failures = [str(result) for result in results if isinstance(result, Exception)]
+                if failures:
+                    raise Exception(f"Reassociation failed for {len(failures)} of {len(attached_resources)} "
+                                    f"attachments: {'; '.join(failures)}")
             
             return {
                 "success": True,
@@ -440,7 +978,7 @@ class PublicIPUpgradeAgent:
             }
             
         except Exception as e:
-            logger.error(f"❌ Enhanced SDK-based upgrade failed: {str(e)}")
+            logger.error("❌ Enhanced SDK-based upgrade failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -448,102 +986,138 @@ class PublicIPUpgradeAgent:
                 "upgrade_method": "enhanced_azure_sdk"
             }
     
-    async def _dissociate_public_ip_http(self, ip_config_id: str, public_ip_url: str, client, headers) -> Dict[str, Any]:
-        """Dissociate Public IP from network interface using HTTP API."""
+    async def _put_standard_sku_http(self, url: str, client, headers, current_config: Dict[str, Any],
+                                     ready: Optional[asyncio.Event] = None) -> "httpx.Response":
+        """Step 3: PUT the Public IP on Standard SKU, once ready (the Public IP is free) is set."""
+        if ready is not None:
+            await ready.wait()
+        logger.info("🔄 Step 3: Updating SKU from Basic to Standard...")
+        
+        # The Public IP as fetched, on Standard SKU and without its ipConfiguration
+        return await _arm(client.put(url, headers=headers, content=_dumps(_standard_sku_body(current_config))))
+    
+    async def _dissociate_public_ip_http(self, ip_config_id: str, public_ip_url: str, client, headers,
+                                         public_ip_etag: Optional[str] = None,
+                                         public_ip_free: Optional[asyncio.Event] = None) -> Dict[str, Any]:
+        """
+        Dissociate Public IP from network interface using HTTP API.
+        
+        public_ip_etag is the ETag of the Public IP as last read (still attached); verification
+        polls send it as If-None-Match so an unchanged resource costs a bodyless 304.
+        public_ip_free, if given, is set as soon as the Public IP itself reports no ipConfiguration.
+        A failure after the NIC PUT went through carries "nic_updated": True, so the caller
+        knows the association has to be restored.
+        """
+        nic_updated = False
         try:
             # Extract network interface ID from IP configuration ID
             # Format: /subscriptions/.../networkInterfaces/nic-name/ipConfigurations/ipconfig-name
-            nic_id = "/".join(ip_config_id.split("/")[:-2])
+            ip_config_rid = _parse_any_id(ip_config_id)
+            nic_id = ip_config_rid.parent_id()
             
-            logger.info(f"🔌 Dissociating Public IP from NIC: {nic_id}")
+            logger.info("🔌 Dissociating Public IP from NIC: %s", nic_id)
             
-            # Get current NIC configuration
             nic_url = f"https://management.azure.com{nic_id}?api-version=2023-09-01"
-            nic_response = await client.get(nic_url, headers=headers)
-            
-            if nic_response.status_code != 200:
-                return {
-                    "success": False,
-                    "message": f"Failed to get NIC configuration: {nic_response.status_code}"
-                }
-            
-            nic_config = nic_response.json()
-            
-            # Find the IP configuration and remove the public IP reference
-            ip_configs = nic_config.get("properties", {}).get("ipConfigurations", [])
-            config_name = ip_config_id.split("/")[-1]
-            
-            for ip_config in ip_configs:
-                if ip_config.get("name") == config_name:
-                    if "publicIPAddress" in ip_config.get("properties", {}):
-                        del ip_config["properties"]["publicIPAddress"]
-                        logger.info(f"🔌 Removed Public IP reference from {config_name}")
-                    break
-            
-            # Update the NIC
-            update_response = await client.put(nic_url, headers=headers, json=nic_config)
+            config_name = ip_config_rid.name
+            async with _nic_lock(nic_id):
+                # Get current NIC configuration
+                nic_response = await _arm(client.get(nic_url, headers=headers))
+                
+                if nic_response.status_code != 200:
+                    return {
+                        "success": False,
+                        "message": f"Failed to get NIC configuration: {nic_response.status_code}"
+                    }
+                
+                nic_config = _loads(nic_response)
+                
+                # Remove the public IP reference from the IP configuration; the rest of the NIC is
+                # sent back as fetched, since the PUT resets anything it leaves out
+                logger.info("🔌 Removing Public IP reference from %s", config_name)
+                
+                # Update the NIC
+                update_response = await _arm(client.put(
+                    nic_url, headers=headers, content=_dumps(_nic_with_public_ip(nic_config, config_name, None))
+                ))
+                # Hold the NIC until ARM has applied the PUT; a PUT on a NIC still updating is rejected
+                operation_error = None
+                if update_response.status_code in [200, 201, 202]:
+                    operation_error = await self._wait_for_async_operation(client, headers, update_response)
             
             if update_response.status_code in [200, 201, 202]:
                 logger.info("✅ Successfully updated NIC to remove Public IP reference")
+                nic_updated = True
                 
-                # Wait longer for the dissociation to propagate in Azure
-                logger.info("⏳ Waiting 10 seconds for dissociation to propagate...")
-                await asyncio.sleep(10)
+                # The PUT response is the NIC's new state; later polls only need to see changes to it
+                updated_nic = _loads(update_response)
+                nic_etag = updated_nic.get("etag")
+                nic_clean = self._nic_config_clean(updated_nic, config_name)
+                ip_free = False
                 
-                # Aggressive verification - check both NIC and Public IP status
-                max_retries = 15  # Increased from 5
+                # ARM reported the NIC update as finished (or failed) instead of a fixed sleep
+                if operation_error:
+                    return {"success": False, "nic_updated": True,
+                            "message": f"NIC update did not complete: {operation_error}"}
+                
+                # Verify both NIC and Public IP status - the operation has completed, so this
+                # only needs to cover propagation to the Public IP's view.
+                # Conditional GETs: a 304 means the resource is unchanged since the last read.
+                max_retries = 3
                 verification_success = False
                 
                 for attempt in range(max_retries):
-                    logger.info(f"🔍 Verification attempt {attempt + 1}/{max_retries}")
+                    logger.info("🔍 Verification attempt %s/%s", attempt + 1, max_retries)
                     
-                    # Check Public IP status
-                    public_ip_response = await client.get(public_ip_url, headers=headers)
-                    public_ip_free = False
+                    # Check Public IP and NIC status concurrently - the reads are independent
+                    public_ip_headers = {**headers, "If-None-Match": public_ip_etag} if public_ip_etag else headers
+                    nic_headers = {**headers, "If-None-Match": nic_etag} if nic_etag else headers
+                    public_ip_response, nic_verify_response = await asyncio.gather(
+                        _arm(client.get(public_ip_url, headers=public_ip_headers)),
+                        _arm(client.get(nic_url, headers=nic_headers))
+                    )
                     
                     if public_ip_response.status_code == 200:
-                        public_ip_data = public_ip_response.json()
+                        public_ip_data = _loads(public_ip_response)
+                        public_ip_etag = public_ip_data.get("etag")
                         ip_config_ref = public_ip_data.get("properties", {}).get("ipConfiguration")
                         
-                        if not ip_config_ref:
-                            public_ip_free = True
+                        ip_free = not ip_config_ref
+                        if ip_free:
                             logger.info("✅ Public IP shows as free")
+                            if public_ip_free is not None:
+                                public_ip_free.set()
                         else:
-                            logger.info(f"⏳ Public IP still attached to: {ip_config_ref.get('id', 'unknown')}")
-                    
-                    # Also check NIC status to double-verify
-                    nic_verify_response = await client.get(nic_url, headers=headers)
-                    nic_clean = False
+                            logger.info("⏳ Public IP still attached to: %s", ip_config_ref.get('id', 'unknown'))
+                    elif public_ip_response.status_code == 304:
+                        logger.info("⏳ Public IP unchanged since last check")
                     
+                    # NIC status double-verifies the dissociation
                     if nic_verify_response.status_code == 200:
-                        nic_verify_data = nic_verify_response.json()
-                        ip_configs_verify = nic_verify_data.get("properties", {}).get("ipConfigurations", [])
-                        
-                        for ip_config_verify in ip_configs_verify:
-                            if ip_config_verify.get("name") == config_name:
-                                if "publicIPAddress" not in ip_config_verify.get("properties", {}):
-                                    nic_clean = True
-                                    logger.info("✅ NIC shows Public IP reference removed")
-                                else:
-                                    logger.info("⏳ NIC still shows Public IP reference")
-                                break
+                        nic_verify_data = _loads(nic_verify_response)
+                        nic_etag = nic_verify_data.get("etag")
+                        nic_clean = self._nic_config_clean(nic_verify_data, config_name)
+                        if nic_clean:
+                            logger.info("✅ NIC shows Public IP reference removed")
+                        else:
+                            logger.info("⏳ NIC still shows Public IP reference")
                     
                     # Both checks must pass
-                    if public_ip_free and nic_clean:
+                    if ip_free and nic_clean:
                         verification_success = True
                         logger.info("✅ Complete dissociation verified!")
                         break
                     
                     # Progressive wait time
-                    wait_time = min(5 + attempt * 2, 30)  # 5, 7, 9, ... up to 30 seconds
-                    logger.info(f"⏳ Waiting {wait_time}s before next verification...")
+                    wait_time = _backoff_delay(attempt, public_ip_response, nic_verify_response)
+                    logger.info("⏳ Waiting %.1fs before next verification...", wait_time)
                     await asyncio.sleep(wait_time)
                 
                 if verification_success:
-                    return {"success": True, "nic_config": nic_config}
+                    return {"success": True, "verified": True, "nic_config": nic_config}
                 else:
                     return {
                         "success": False,
+                        "nic_updated": True,
                         "message": f"Failed to verify complete dissociation after {max_retries} attempts. The Public IP may still be in use."
                     }
             else:
@@ -553,45 +1127,86 @@ class PublicIPUpgradeAgent:
                 }
                 
         except Exception as e:
-            logger.error(f"❌ Dissociation failed: {str(e)}")
-            return {"success": False, "message": f"Dissociation error: {str(e)}"}
+            logger.error("❌ Dissociation failed: %s", e)
+            return {"success": False, "nic_updated": nic_updated, "message": f"Dissociation error: {str(e)}"}
+    
+    async def _wait_for_async_operation(self, client, headers, response: "httpx.Response",
+                                        timeout: float = 300) -> Optional[str]:
+        """
+        Poll the operation behind a PUT via its Azure-AsyncOperation or Location header.
+        
+        Returns None once the operation has succeeded (or when the PUT completed synchronously
+        and carries no operation header), otherwise a short description of the failure.
+        """
+        async_operation_url = response.headers.get("Azure-AsyncOperation")
+        location_url = response.headers.get("Location")
+        if not async_operation_url and not location_url:
+            return None
+        
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            poll_response = await _arm(client.get(async_operation_url or location_url, headers=headers))
+            if async_operation_url:
+                status = _loads(poll_response).get("status") if poll_response.status_code == 200 else None
+                if status == "Succeeded":
+                    return None
+                if status in ("Failed", "Canceled"):
+                    return status
+            elif poll_response.status_code in (200, 204):
+                return None
+            elif poll_response.status_code != 202:
+                return f"HTTP {poll_response.status_code}"
+            
+            # Network operations ask for long Retry-After values even when they finish quickly
+            await asyncio.sleep(min(float(poll_response.headers.get("Retry-After", 1)), MAX_LRO_POLL_DELAY))
+        return f"timed out after {timeout:.0f}s"
+    
+    @staticmethod
+    def _nic_config_clean(nic_data: Dict[str, Any], config_name: str) -> bool:
+        """True when the named IP configuration of the NIC no longer references a Public IP."""
+        for ip_config in nic_data.get("properties", {}).get("ipConfigurations", []):
+            if ip_config.get("name") == config_name:
+                return "publicIPAddress" not in ip_config.get("properties", {})
+        return False
     
     async def _reassociate_public_ip_http(self, ip_config_id: str, public_ip_id: str, client, headers) -> Dict[str, Any]:
         """Re-associate Public IP with network interface using HTTP API."""
         try:
             # Extract network interface ID from IP configuration ID
-            nic_id = "/".join(ip_config_id.split("/")[:-2])
+            ip_config_rid = _parse_any_id(ip_config_id)
+            nic_id = ip_config_rid.parent_id()
             
-            logger.info(f"🔗 Re-associating Public IP with NIC: {nic_id}")
+            logger.info("🔗 Re-associating Public IP with NIC: %s", nic_id)
             
-            # Get current NIC configuration
             nic_url = f"https://management.azure.com{nic_id}?api-version=2023-09-01"
-            nic_response = await client.get(nic_url, headers=headers)
-            
-            if nic_response.status_code != 200:
-                return {
-                    "success": False,
-                    "message": f"Failed to get NIC configuration: {nic_response.status_code}"
-                }
-            
-            nic_config = nic_response.json()
-            
-            # Find the IP configuration and add the public IP reference
-            ip_configs = nic_config.get("properties", {}).get("ipConfigurations", [])
-            config_name = ip_config_id.split("/")[-1]
-            
-            for ip_config in ip_configs:
-                if ip_config.get("name") == config_name:
-                    if "properties" not in ip_config:
-                        ip_config["properties"] = {}
-                    ip_config["properties"]["publicIPAddress"] = {"id": public_ip_id}
-                    logger.info(f"🔗 Added Public IP reference to {config_name}")
-                    break
-            
-            # Update the NIC
-            update_response = await client.put(nic_url, headers=headers, json=nic_config)
+            config_name = ip_config_rid.name
+            async with _nic_lock(nic_id):
+                # Get current NIC configuration
+                nic_response = await _arm(client.get(nic_url, headers=headers))
+                
+                if nic_response.status_code != 200:
+                    return {
+                        "success": False,
+                        "message": f"Failed to get NIC configuration: {nic_response.status_code}"
+                    }
+                
+                nic_config = _loads(nic_response)
+                
+                # Add the public IP reference to the IP configuration (full NIC body, as above)
+                logger.info("🔗 Adding Public IP reference to %s", config_name)
+                
+                # Update the NIC
+                update_response = await _arm(client.put(
+                    nic_url, headers=headers, content=_dumps(_nic_with_public_ip(nic_config, config_name, public_ip_id))
+                ))
+                # Hold the NIC until ARM has applied the PUT; a PUT on a NIC still updating is rejected
+                operation_error = None
+                if update_response.status_code in [200, 201, 202]:
+                    operation_error = await self._wait_for_async_operation(client, headers, update_response)
             
             if update_response.status_code in [200, 201, 202]:
+                if operation_error:
+                    return {"success": False, "message": f"NIC update did not complete: {operation_error}"}
                 logger.info("✅ Successfully re-associated Public IP with NIC")
                 return {"success": True}
             else:
@@ -601,488 +1216,157 @@ class PublicIPUpgradeAgent:
                 }
                 
         except Exception as e:
-            logger.error(f"❌ Re-association failed: {str(e)}")
+            logger.error("❌ Re-association failed: %s", e)
             return {"success": False, "message": f"Re-association error: {str(e)}"}
     
-    def _parse_resource_id(self, resource_id: str) -> Optional[Dict[str, str]]:
-        """Parse Azure resource ID into components."""
-        try:
-            parts = resource_id.strip('/').split('/')
-            if len(parts) >= 8 and 'publicIPAddresses' in parts:
-                return {
-                    'subscription_id': parts[1],
-                    'resource_group': parts[3],
-                    'resource_name': parts[-1]
-                }
-        except Exception as e:
-            logger.error(f"Failed to parse resource ID: {str(e)}")
-        return None
-    
-    async def _get_public_ip_details(self, resource_group: str, resource_name: str) -> Optional[PublicIPAddress]:
-        """Get current Public IP configuration."""
-        try:
-            public_ip = self.network_client.public_ip_addresses.get(
-                resource_group_name=resource_group,
-                public_ip_address_name=resource_name
-            )
-            logger.info(f"Retrieved Public IP details: {resource_name} (SKU: {public_ip.sku.name})")
-            return public_ip
-        except Exception as e:
-            logger.error(f"Failed to get Public IP details: {str(e)}")
-            return None
-    
-    async def _find_attached_resources(self, resource_group: str, public_ip_name: str) -> List[Dict[str, Any]]:
-        """Find all resources attached to this Public IP."""
-        attached_resources = []
-        
-        try:
-            # Get the Public IP to check its configuration
-            public_ip = self.network_client.public_ip_addresses.get(
-                resource_group_name=resource_group,
-                public_ip_address_name=public_ip_name
-            )
-            
-            # Check if attached to Network Interface
-            if public_ip.ip_configuration:
-                attached_resources.append({
-                    'type': 'NetworkInterface',
-                    'id': public_ip.ip_configuration.id,
-                    'name': public_ip.ip_configuration.id.split('/')[-3] if public_ip.ip_configuration.id else None
-                })
-            
-            # Check Load Balancers in the resource group
-            load_balancers = self.network_client.load_balancers.list(resource_group)
-            for lb in load_balancers:
-                for frontend_config in lb.frontend_ip_configurations or []:
-                    if (frontend_config.public_ip_address and 
-                        frontend_config.public_ip_address.id and
-                        public_ip_name in frontend_config.public_ip_address.id):
-                        attached_resources.append({
-                            'type': 'LoadBalancer',
-                            'id': lb.id,
-                            'name': lb.name,
-                            'frontend_config': frontend_config.name
-                        })
-            
-            # Check Application Gateways
-            try:
-                app_gateways = self.network_client.application_gateways.list(resource_group)
-                for ag in app_gateways:
-                    for frontend_config in ag.frontend_ip_configurations or []:
-                        if (frontend_config.public_ip_address and 
-                            frontend_config.public_ip_address.id and
-                            public_ip_name in frontend_config.public_ip_address.id):
-                            attached_resources.append({
-                                'type': 'ApplicationGateway',
-                                'id': ag.id,
-                                'name': ag.name,
-                                'frontend_config': frontend_config.name
-                            })
-            except Exception as e:
-                logger.warning(f"Could not check Application Gateways: {str(e)}")
-            
-            logger.info(f"Found attached resources: {[r['type'] + ':' + r['name'] for r in attached_resources]}")
-            return attached_resources
-            
-        except Exception as e:
-            logger.error(f"Failed to find attached resources: {str(e)}")
-            return []
-    
-    async def _dissociate_from_resources(self, resource_group: str, attached_resources: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Dissociate Public IP from all attached resources."""
-        original_configs = {}
-        
-        try:
-            for resource in attached_resources:
-                if resource['type'] == 'NetworkInterface':
-                    # Handle Network Interface dissociation
-                    nic_name = resource['name']
-                    if nic_name:
-                        nic = self.network_client.network_interfaces.get(resource_group, nic_name)
-                        original_configs[resource['id']] = {
-                            'type': 'NetworkInterface',
-                            'name': nic_name,
-                            'ip_configurations': []
-                        }
-                        
-                        # Store original IP configurations and remove public IP references
-                        for ip_config in nic.ip_configurations or []:
-                            original_configs[resource['id']]['ip_configurations'].append({
-                                'name': ip_config.name,
-                                'had_public_ip': ip_config.public_ip_address is not None,
-                                'public_ip_id': ip_config.public_ip_address.id if ip_config.public_ip_address else None
-                            })
-                            
-                            # Remove public IP reference
-                            if ip_config.public_ip_address:
-                                ip_config.public_ip_address = None
-                        
-                        # Update the NIC
-                        operation = self.network_client.network_interfaces.begin_create_or_update(
-                            resource_group, nic_name, nic
-                        )
-                        operation.wait()
-                        logger.info(f"Dissociated Public IP from Network Interface: {nic_name}")
-                
-                elif resource['type'] == 'LoadBalancer':
-                    # Handle Load Balancer dissociation
-                    lb_name = resource['name']
-                    lb = self.network_client.load_balancers.get(resource_group, lb_name)
-                    original_configs[resource['id']] = {
-                        'type': 'LoadBalancer',
-                        'name': lb_name,
-                        'frontend_configs': []
-                    }
-                    
-                    # Store original frontend configurations and remove public IP references
-                    for frontend_config in lb.frontend_ip_configurations or []:
-                        original_configs[resource['id']]['frontend_configs'].append({
-                            'name': frontend_config.name,
-                            'had_public_ip': frontend_config.public_ip_address is not None,
-                            'public_ip_id': frontend_config.public_ip_address.id if frontend_config.public_ip_address else None
-                        })
-                        
-                        # Remove public IP reference if it matches
-                        if (frontend_config.public_ip_address and 
-                            resource.get('frontend_config') == frontend_config.name):
-                            frontend_config.public_ip_address = None
-                    
-                    # Update the Load Balancer
-                    operation = self.network_client.load_balancers.begin_create_or_update(
-                        resource_group, lb_name, lb
-                    )
-                    operation.wait()
-                    logger.info(f"Dissociated Public IP from Load Balancer: {lb_name}")
-            
-            return {
-                'success': True,
-                'original_configs': original_configs,
-                'dissociated_count': len(attached_resources)
-            }
-            
-        except Exception as e:
-            logger.error(f"Failed to dissociate resources: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'original_configs': original_configs
-            }
-    
-    async def _upgrade_sku(self, resource_group: str, public_ip_name: str, current_config: PublicIPAddress) -> Dict[str, Any]:
-        """Upgrade the Public IP SKU from Basic to Standard."""
-        try:
-            # Create updated configuration with Standard SKU
-            updated_config = PublicIPAddress(
-                location=current_config.location,
-                sku=PublicIPAddressSku(
-                    name=PublicIPAddressSkuName.STANDARD,
-                    tier=PublicIPAddressSkuTier.REGIONAL
-                ),
-                public_ip_allocation_method=current_config.public_ip_allocation_method,
-                public_ip_address_version=current_config.public_ip_address_version,
-                dns_settings=current_config.dns_settings,
-                tags=current_config.tags
-            )
-            
-            # Perform the upgrade
-            logger.info(f"Upgrading Public IP SKU: {public_ip_name}")
-            operation = self.network_client.public_ip_addresses.begin_create_or_update(
-                resource_group_name=resource_group,
-                public_ip_address_name=public_ip_name,
-                parameters=updated_config
-            )
-            
-            # Wait for completion
-            result = operation.wait()
-            
-            logger.info(f"SKU upgrade completed: {public_ip_name} -> Standard")
-            return {
-                'success': True,
-                'new_sku': 'Standard',
-                'resource_id': result.id
-            }
-            
-        except Exception as e:
-            logger.error(f"SKU upgrade failed: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
-    
-    async def _re_associate_resources(self, resource_group: str, attached_resources: List[Dict[str, Any]], 
-                                    original_configs: Dict[str, Any]) -> Dict[str, Any]:
-        """Re-associate the upgraded Public IP with its original resources."""
-        try:
-            success_count = 0
-            errors = []
-            
-            for resource in attached_resources:
-                resource_config = original_configs.get(resource['id'])
-                if not resource_config:
-                    continue
-                
-                try:
-                    if resource_config['type'] == 'NetworkInterface':
-                        # Re-associate with Network Interface
-                        nic_name = resource_config['name']
-                        nic = self.network_client.network_interfaces.get(resource_group, nic_name)
-                        
-                        # Restore public IP references
-                        for i, ip_config in enumerate(nic.ip_configurations or []):
-                            original_ip_config = resource_config['ip_configurations'][i]
-                            if original_ip_config['had_public_ip']:
-                                # Get the upgraded public IP reference
-                                public_ip_ref = self.network_client.public_ip_addresses.get(
-                                    resource_group, 
-                                    original_ip_config['public_ip_id'].split('/')[-1]
-                                )
-                                ip_config.public_ip_address = public_ip_ref
-                        
-                        # Update the NIC
-                        operation = self.network_client.network_interfaces.begin_create_or_update(
-                            resource_group, nic_name, nic
-                        )
-                        operation.wait()
-                        success_count += 1
-                        logger.info(f"Re-associated Public IP with Network Interface: {nic_name}")
-                    
-                    elif resource_config['type'] == 'LoadBalancer':
-                        # Re-associate with Load Balancer
-                        lb_name = resource_config['name']
-                        lb = self.network_client.load_balancers.get(resource_group, lb_name)
-                        
-                        # Restore public IP references
-                        for frontend_config in lb.frontend_ip_configurations or []:
-                            for original_frontend in resource_config['frontend_configs']:
-                                if (frontend_config.name == original_frontend['name'] and 
-                                    original_frontend['had_public_ip']):
-                                    # Get the upgraded public IP reference
-                                    public_ip_ref = self.network_client.public_ip_addresses.get(
-                                        resource_group,
-                                        original_frontend['public_ip_id'].split('/')[-1]
-                                    )
-                                    frontend_config.public_ip_address = public_ip_ref
-                        
-                        # Update the Load Balancer
-                        operation = self.network_client.load_balancers.begin_create_or_update(
-                            resource_group, lb_name, lb
-                        )
-                        operation.wait()
-                        success_count += 1
-                        logger.info(f"Re-associated Public IP with Load Balancer: {lb_name}")
-                        
-                except Exception as e:
-                    error_msg = f"Failed to re-associate with {resource_config['name']}: {str(e)}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
-            
-            return {
-                'success': len(errors) == 0,
-                'success_count': success_count,
-                'total_resources': len(attached_resources),
-                'errors': errors
-            }
-            
-        except Exception as e:
-            logger.error(f"Re-association process failed: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
-
-    def _get_manual_upgrade_instructions(self, resource_id: str) -> Dict[str, Any]:
+    @staticmethod
+    def _get_manual_upgrade_instructions(resource_id: str) -> Dict[str, Any]:
         """Provide manual upgrade instructions when automation is not available."""
         resource_name = resource_id.split('/')[-1] if resource_id else "your-public-ip"
         
-        return {
-            "title": "Public IP Address Upgrade (Basic to Standard SKU)",
-            "estimated_time": "5-10 minutes",
-            "resource_name": resource_name,
-            "prerequisites": [
-                "Ensure the Public IP is not currently in use",
-                "Verify you have Network Contributor permissions",
-                "Consider maintenance window if IP is critical"
-            ],
-            "steps": [
-                {
-                    "step": 1,
-                    "action": "Navigate to Azure Portal",
-                    "details": "Open Azure Portal (portal.azure.com) and search for 'Public IP addresses'"
-                },
-                {
-                    "step": 2,
-                    "action": "Locate and select your Public IP",
-                    "details": f"Find and click on the Public IP resource: {resource_name}"
-                },
-                {
-                    "step": 3,
-                    "action": "Check current associations",
-                    "details": "In the Overview tab, note any associated resources (VMs, Load Balancers, etc.)"
-                },
-                {
-                    "step": 4,
-                    "action": "Dissociate if needed",
-                    "details": "If associated with resources, dissociate them first (will cause temporary downtime)"
-                },
-                {
-                    "step": 5,
-                    "action": "Upgrade SKU",
-                    "details": "Go to Configuration tab → Change SKU from Basic to Standard → Save"
-                },
-                {
-                    "step": 6,
-                    "action": "Re-associate resources",
-                    "details": "Re-associate with the original resources to restore connectivity"
-                }
-            ],
-            "warnings": [
-                "⚠️  This upgrade will cause temporary downtime while dissociated",
-                "⚠️  Standard SKU Public IPs have different pricing",
-                "⚠️  Some legacy configurations may not be compatible"
-            ],
-            "post_upgrade": [
-                "Verify connectivity to associated resources",
-                "Test any applications that depend on this IP",
-                "Update DNS records if the IP address changed"
-            ]
-        }
+        instructions = copy.deepcopy(_MANUAL_UPGRADE_INSTRUCTIONS)
+        instructions["resource_name"] = resource_name
+        step = instructions["steps"][1]
+        step["details"] = step["details"].format(resource_name=resource_name)
+        return instructions
 
     async def _perform_complete_dissociation(self, network_client, resource_group: str, 
                                            nic_name: str, config_name: str, public_ip_name: str):
         """
         Perform complete dissociation with enhanced verification and retry logic.
         This method ensures the Public IP is fully released from Azure's perspective.
+        Returns the Public IP as last read once verified free, or None when it has no fresh read.
         """
-        import asyncio
-        
-        logger.info(f"🔌 Starting complete dissociation process for {public_ip_name}")
-        
-        # Step 1: Get the current NIC configuration
-        nic = network_client.network_interfaces.get(resource_group, nic_name)
-        
-        # Step 2: Remove public IP reference from the specified configuration
-        public_ip_removed = False
-        for ip_config in nic.ip_configurations:
-            if ip_config.name == config_name:
-                if ip_config.public_ip_address:
-                    logger.info(f"🔌 Removing Public IP reference from {config_name}")
-                    ip_config.public_ip_address = None
-                    public_ip_removed = True
-                break
+        logger.info("🔌 Starting complete dissociation process for %s", public_ip_name)
         
-        if not public_ip_removed:
-            logger.warning("⚠️ No public IP reference found to remove")
-            return
+        async with _nic_lock(_sdk_nic_id(self.subscription_id, resource_group, nic_name)):
+            # Step 1: Get the current NIC configuration
+            nic = await _arm(network_client.network_interfaces.get(resource_group, nic_name))
+            
+            # Step 2: Remove public IP reference from the specified configuration
+            ip_config = _find_ip_configuration(nic, config_name)
+            if ip_config is None or not ip_config.public_ip_address:
+                logger.warning("⚠️ No public IP reference found to remove")
+                return None
+            logger.info("🔌 Removing Public IP reference from %s", config_name)
+            ip_config.public_ip_address = None
+            
+            # Step 3: Update the NIC with enhanced waiting
+            logger.info("🔄 Updating NIC to dissociate Public IP...")
+            update_poller = await _arm(network_client.network_interfaces.begin_create_or_update(
+                resource_group, nic_name, nic,
+                polling=_fast_async_polling()
+            ))
+            
+            # Wait for NIC update to complete with timeout; the NIC stays locked until then,
+            # as a PUT on a NIC still updating is rejected
+            logger.info("⏳ Waiting for NIC update to complete...")
+            updated_nic = await _lro_result(update_poller, NIC_UPDATE_TIMEOUT_SECONDS)
+        logger.info("✅ NIC update operation completed")
         
-        # Step 3: Update the NIC with enhanced waiting
-        logger.info("🔄 Updating NIC to dissociate Public IP...")
-        update_poller = network_client.network_interfaces.begin_create_or_update(
-            resource_group, nic_name, nic
-        )
+        def has_public_ip(current_nic) -> bool:
+            current_config = _find_ip_configuration(current_nic, config_name)
+            return current_config is not None and current_config.public_ip_address is not None
         
-        # Wait for NIC update to complete with timeout
-        logger.info("⏳ Waiting for NIC update to complete...")
-        update_result = update_poller.result(timeout=180)  # 3 minute timeout
-        logger.info("✅ NIC update operation completed")
+        # The poller's terminal state is the NIC as ARM stored it, so the NIC side only
+        # needs re-reading if that still shows the reference
+        nic_has_public_ip = has_public_ip(updated_nic)
         
         # Step 4: Enhanced verification with multiple checks
         logger.info("🔍 Performing enhanced dissociation verification...")
         
-        max_attempts = 12  # Increased verification attempts
-        verification_delay = 15  # Longer delay between checks
+        # Exponential backoff with jitter instead of a fixed 15s, within the same overall ceiling
+        deadline = time.monotonic() + SDK_DISSOCIATION_VERIFY_TIMEOUT_SECONDS
+        attempt = 0
         
-        for attempt in range(max_attempts):
-            logger.info(f"🔍 Verification attempt {attempt + 1}/{max_attempts}")
+        while time.monotonic() < deadline:
+            attempt += 1
+            logger.info("🔍 Verification attempt %s", attempt)
             
-            # Check both NIC and Public IP perspectives
+            # Check both NIC and Public IP perspectives - the reads are independent
             try:
-                # Check from NIC perspective
-                current_nic = network_client.network_interfaces.get(resource_group, nic_name)
-                nic_has_public_ip = False
-                
-                for ip_config in current_nic.ip_configurations:
-                    if ip_config.name == config_name and ip_config.public_ip_address:
-                        nic_has_public_ip = True
-                        break
-                
-                # Check from Public IP perspective
-                current_public_ip = network_client.public_ip_addresses.get(resource_group, public_ip_name)
+                if nic_has_public_ip:
+                    current_nic, current_public_ip = await asyncio.gather(
+                        _arm(network_client.network_interfaces.get(resource_group, nic_name)),
+                        _arm(network_client.public_ip_addresses.get(resource_group, public_ip_name))
+                    )
+                    nic_has_public_ip = has_public_ip(current_nic)
+                else:
+                    current_public_ip = await _arm(network_client.public_ip_addresses.get(resource_group, public_ip_name))
                 public_ip_attached = current_public_ip.ip_configuration is not None
                 
                 if not nic_has_public_ip and not public_ip_attached:
                     logger.info("✅ Complete dissociation verified from both perspectives")
-                    return
+                    return current_public_ip
                 
-                logger.info(f"⏳ Still attached (NIC: {nic_has_public_ip}, Public IP: {public_ip_attached}) - waiting {verification_delay}s...")
-                await asyncio.sleep(verification_delay)
+                logger.info("⏳ Still attached (NIC: %s, Public IP: %s)", nic_has_public_ip, public_ip_attached)
                 
             except Exception as e:
-                logger.warning(f"⚠️ Verification attempt {attempt + 1} failed: {str(e)}")
-                await asyncio.sleep(verification_delay)
+                logger.warning("⚠️ Verification attempt %s failed: %s", attempt, e)
+            
+            wait_time = min(_backoff_delay(attempt - 1), max(deadline - time.monotonic(), 0.0))
+            logger.info("⏳ Waiting %.1fs before next verification...", wait_time)
+            await asyncio.sleep(wait_time)
         
         # Final verification - if still attached, throw error
         try:
-            final_public_ip = network_client.public_ip_addresses.get(resource_group, public_ip_name)
+            final_public_ip = await _arm(network_client.public_ip_addresses.get(resource_group, public_ip_name))
             if final_public_ip.ip_configuration:
-                raise Exception(f"Public IP {public_ip_name} is still attached after {max_attempts} verification attempts. Manual intervention may be required.")
+                raise Exception(f"Public IP {public_ip_name} is still attached after {attempt} verification attempts. Manual intervention may be required.")
         except Exception as e:
             if "still attached" in str(e):
                 raise e
-            logger.warning(f"Final verification failed: {str(e)}")
+            logger.warning("Final verification failed: %s", e)
         
         logger.info("✅ Dissociation process completed")
+        return None
 
     async def _perform_reassociation(self, network_client, attachment: dict, 
                                    resource_group: str, public_ip_name: str):
         """
         Perform reassociation with proper error handling and verification.
         """
-        import asyncio
-        
         nic_name = attachment["nic_name"]
         config_name = attachment["config_name"]
         
-        logger.info(f"🔄 Starting reassociation of {public_ip_name} to {nic_name}.{config_name}")
+        logger.info("🔄 Starting reassociation of %s to %s.%s", public_ip_name, nic_name, config_name)
         
         try:
-            # Get fresh references to both resources
-            nic = network_client.network_interfaces.get(resource_group, nic_name)
-            public_ip_ref = network_client.public_ip_addresses.get(resource_group, public_ip_name)
-            
-            # Find the correct IP configuration and reassociate
-            reassociated = False
-            for ip_config in nic.ip_configurations:
-                if ip_config.name == config_name:
-                    logger.info(f"🔗 Reassociating Public IP to {config_name}")
-                    ip_config.public_ip_address = public_ip_ref
-                    reassociated = True
-                    break
-            
-            if not reassociated:
-                raise Exception(f"Could not find IP configuration {config_name} for reassociation")
-            
-            # Update the NIC
-            logger.info("🔄 Updating NIC with reassociated Public IP...")
-            reassoc_poller = network_client.network_interfaces.begin_create_or_update(
-                resource_group, nic_name, nic
-            )
-            
-            # Wait for reassociation to complete
-            logger.info("⏳ Waiting for reassociation to complete...")
-            reassoc_result = reassoc_poller.result(timeout=180)  # 3 minute timeout
+            async with _nic_lock(_sdk_nic_id(self.subscription_id, resource_group, nic_name)):
+                # Get a fresh NIC; ARM only needs the id to link the upgraded Public IP
+                nic = await _arm(network_client.network_interfaces.get(resource_group, nic_name))
+                public_ip_ref = PublicIPAddress(id=attachment["public_ip_id"])
+                
+                # Find the correct IP configuration and reassociate
+                ip_config = _find_ip_configuration(nic, config_name)
+                if ip_config is None:
+                    raise Exception(f"Could not find IP configuration {config_name} for reassociation")
+                logger.info("🔗 Reassociating Public IP to %s", config_name)
+                ip_config.public_ip_address = public_ip_ref
+                
+                # Update the NIC
+                logger.info("🔄 Updating NIC with reassociated Public IP...")
+                reassoc_poller = await _arm(network_client.network_interfaces.begin_create_or_update(
+                    resource_group, nic_name, nic,
+                    polling=_fast_async_polling()
+                ))
+                
+                # Wait for reassociation to complete (still holding the NIC, as above)
+                logger.info("⏳ Waiting for reassociation to complete...")
+                await _lro_result(reassoc_poller, NIC_UPDATE_TIMEOUT_SECONDS)
             logger.info("✅ Reassociation completed successfully")
             
             # Verify reassociation
             await asyncio.sleep(5)  # Brief wait for consistency
             
-            updated_public_ip = network_client.public_ip_addresses.get(resource_group, public_ip_name)
+            updated_public_ip = await _arm(network_client.public_ip_addresses.get(resource_group, public_ip_name))
             if updated_public_ip.ip_configuration:
                 logger.info("✅ Reassociation verified - Public IP is properly attached")
             else:
                 logger.warning("⚠️ Reassociation may not have completed - Public IP shows as unattached")
                 
         except Exception as e:
-            logger.error(f"❌ Reassociation failed: {str(e)}")
+            logger.error("❌ Reassociation failed: %s", e)
             raise Exception(f"Failed to reassociate Public IP {public_ip_name} to {nic_name}: {str(e)}")
 
 
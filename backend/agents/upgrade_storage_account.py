@@ -9,20 +9,30 @@ Date: July 29, 2025
 """
 
 import asyncio
+import itertools
 import logging
-from typing import Dict, List, Any, Optional
+import re
+import time
+from typing import Dict, List, Any, Optional, Iterator, Sequence, Tuple
 import json
 
+from .upgrade_batch import upgrade_each_once
+
 # Optional Azure SDK imports - graceful fallback if not available
 try:
-    from azure.identity import DefaultAzureCredential
-    from azure.mgmt.storage import StorageManagementClient
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.identity.aio import DefaultAzureCredential
+    from azure.mgmt.storage.aio import StorageManagementClient
     from azure.mgmt.storage.models import StorageAccount, StorageAccountUpdateParameters, Sku, SkuName, Kind
     AZURE_SDK_AVAILABLE = True
 except ImportError as e:
-    logging.warning(f"Azure SDK not available: {e}")
+    logging.warning("Azure SDK not available: %s", e)
     AZURE_SDK_AVAILABLE = False
+    aiohttp = None
     # Create dummy classes to prevent import errors
+    class AioHttpTransport:
+        pass
     class DefaultAzureCredential:
         pass
     class StorageManagementClient:
@@ -38,21 +48,126 @@ except ImportError as e:
     class Kind:
         pass
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upgrades in flight at once in upgrade_storage_accounts_automated; ARM starts
+# stalling requests well before a tenant-sized burst of unbounded calls
+MAX_CONCURRENT_UPGRADES = 16
+
+# Upgrade decision table: zone-redundant SKU each replicated SKU moves to, the regions
+# assumed to offer it when the subscription's SKU list is unavailable, and the kinds
+# with blob access tiers that lifecycle management applies to
+_SKU_UPGRADES = {'Standard_LRS': 'Standard_ZRS', 'Standard_GRS': 'Standard_GZRS'}
+_KNOWN_ZONE_REDUNDANT_REGIONS = frozenset({'eastus', 'westus2', 'northeurope', 'westeurope'})
+_TIERED_KINDS = frozenset({'StorageV2', 'BlobStorage'})
+
+# (sku, kind, access tier) states none of the rules above can improve, wherever the account
+# lives - the steady state of a swept tenant, answered without walking the rules
+_OPTIMAL_STATES = frozenset(
+    (sku, kind, tier)
+    for sku in ('Standard_ZRS', 'Standard_GZRS', 'Standard_RAGZRS', 'Premium_ZRS')
+    for kind in ('StorageV2', 'BlockBlobStorage', 'FileStorage')
+    for tier in ('Cool', 'Cold', None)
+)
+
+# Fixed report text: benefits of each rule and the steps of a successful upgrade
+_SKU_BENEFITS = ('Higher availability with zone redundancy',)
+_KIND_BENEFITS = ('Access to latest storage features', 'Better cost optimization options')
+_TIER_BENEFITS = ('Automatic cost optimization',)
+_STEPS_COMPLETED = (
+    "✅ Analyzed storage account configuration",
+    "✅ Identified optimization opportunities",
+    "✅ Applied performance and efficiency upgrades",
+    "✅ Validated new configuration"
+)
+
+# Storage Account resource ID; anchored so other resource types and malformed IDs don't match
+_RID_RE = re.compile(
+    r"^/subscriptions/(?P<sub>[^/]+)/resourceGroups/(?P<rg>[^/]+)"
+    r"/providers/Microsoft\.Storage/storageAccounts/(?P<name>[^/]+)/?$",
+    re.IGNORECASE
+)
+
+# Shared SDK clients - one credential per process and one StorageManagementClient per
+# subscription, all on a single aiohttp session, so agents reuse tokens and keep-alive
+# connections instead of paying token discovery and a TCP + TLS handshake each.
+# Created synchronously on first use, so no lock is needed on the event loop.
+_credential = None
+_aiohttp_session = None
+_storage_clients: Dict[str, StorageManagementClient] = {}
+
+def _get_storage_client(subscription_id: str) -> StorageManagementClient:
+    """Return the cached StorageManagementClient for a subscription, creating it on first use."""
+    global _credential, _aiohttp_session
+    client = _storage_clients.get(subscription_id)
+    if client is None:
+        if _credential is None:
+            _credential = DefaultAzureCredential()
+        if _aiohttp_session is None:
+            _aiohttp_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, limit_per_host=16, keepalive_timeout=60)
+            )
+        client = StorageManagementClient(
+            _credential,
+            subscription_id,
+            # Not the session owner: the pool outlives any one client
+            transport=AioHttpTransport(session=_aiohttp_session, session_owner=False)
+        )
+        _storage_clients[subscription_id] = client
+    return client
+
+# Read-through caches for tenant sweeps that revisit accounts (analysis, dry run, upgrade):
+# account properties by (subscription, resource group, name), kept briefly and replaced by
+# the update's own response; zone-redundant SKU regions by subscription, which rarely change
+PROPERTIES_CACHE_TTL_SECONDS = 60.0
+SKU_LOCATIONS_CACHE_TTL_SECONDS = 3600.0
+# Per cache; beyond it the oldest entries go first, so long-running sweeps stay bounded
+CACHE_MAX_ENTRIES = 4096
+_properties_cache: Dict[tuple, tuple] = {}
+_sku_locations_cache: Dict[str, tuple] = {}
+
+def _cache_get(cache: Dict[Any, tuple], key: Any, ttl: float) -> Optional[Any]:
+    """Return the cached value for key if it is younger than ttl seconds, dropping it once expired."""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] < ttl:
+        return entry[1]
+    del cache[key]
+    return None
+
+def _cache_put(cache: Dict[Any, tuple], key: Any, value: Any) -> None:
+    # Re-inserted rather than updated in place, so the dict stays ordered oldest first
+    cache.pop(key, None)
+    cache[key] = (time.monotonic(), value)
+    if len(cache) > CACHE_MAX_ENTRIES:
+        del cache[next(iter(cache))]
+
+async def close_shared_clients():
+    """Close the cached storage clients, their session and the credential (call on application shutdown)."""
+    global _credential, _aiohttp_session
+    for client in _storage_clients.values():
+        await client.close()
+    _storage_clients.clear()
+    if _aiohttp_session is not None:
+        await _aiohttp_session.close()
+        _aiohttp_session = None
+    if _credential is not None:
+        await _credential.close()
+        _credential = None
+
 class StorageAccountUpgradeAgent:
     """
     Automated agent for upgrading Storage Accounts to more efficient configurations.
     Handles SKU upgrades, performance tier changes, and feature enablement.
     """
     
+    __slots__ = ('subscription_id', 'storage_client')
+    
     def __init__(self, subscription_id: str):
-        """Initialize the upgrade agent."""
+        """Initialize the upgrade agent on the process-wide clients (closed by close_shared_clients)."""
         self.subscription_id = subscription_id
-        self.credential = DefaultAzureCredential()
-        self.storage_client = StorageManagementClient(self.credential, subscription_id)
+        self.storage_client = _get_storage_client(subscription_id)
         
     async def upgrade_storage_account(self, resource_id: str) -> Dict[str, Any]:
         """
@@ -65,43 +180,59 @@ class StorageAccountUpgradeAgent:
             Dict containing upgrade results and details
         """
         try:
-            logger.info(f"Starting automated Storage Account upgrade: {resource_id}")
+            logger.info("Starting automated Storage Account upgrade: %s", resource_id)
             
             # Parse resource ID
             resource_parts = self._parse_resource_id(resource_id)
             if not resource_parts:
                 return {"success": False, "error": "Invalid resource ID format"}
                 
-            # Get current Storage Account configuration
-            current_config = await self._get_storage_account_details(
-                resource_parts['resource_group'], 
-                resource_parts['resource_name']
+            # Get current Storage Account configuration and where zone-redundant SKUs are
+            # offered - independent ARM reads, so they run concurrently
+            current_config, sku_locations = await asyncio.gather(
+                self._get_storage_account_details(
+                    resource_parts['resource_group'], 
+                    resource_parts['resource_name']
+                ),
+                self._get_zone_redundant_sku_locations(),
+                return_exceptions=True
             )
             
-            if not current_config:
+            if not current_config or isinstance(current_config, Exception):
                 return {"success": False, "error": "Could not retrieve Storage Account details"}
+            if isinstance(sku_locations, Exception):
+                logger.warning("Could not list storage SKUs, using known zone-redundant regions: %s", sku_locations)
+                sku_locations = None
+            sku = current_config.sku
+            current_sku = sku.name.value if sku else "Unknown"
                 
-            # Analyze current configuration and determine upgrades
-            upgrade_plan = await self._analyze_upgrade_opportunities(current_config)
+            # Analyze current configuration and determine upgrades; the common "nothing to
+            # do" case stops after one next() without building the plan
+            opportunities = self._iter_upgrade_opportunities(current_config, sku_locations)
+            first = next(opportunities, None)
             
-            if not upgrade_plan['upgrades_available']:
+            if first is None:
+                kind = current_config.kind
+                access_tier = getattr(current_config, 'access_tier', None)
                 return {
                     "success": True, 
                     "message": "Storage Account is already optimally configured",
                     "skipped": True,
                     "current_config": {
-                        "sku": current_config.sku.name.value if current_config.sku else "Unknown",
-                        "kind": current_config.kind.value if current_config.kind else "Unknown",
-                        "access_tier": current_config.access_tier.value if current_config.access_tier else "Unknown"
+                        "sku": current_sku,
+                        "kind": kind.value if kind else "Unknown",
+                        "access_tier": access_tier.value if access_tier else "Unknown"
                     }
                 }
                 
+            recommended_upgrades, benefit_groups = zip(*itertools.chain((first,), opportunities))
+            
             # Perform the upgrades
             upgrade_results = await self._perform_upgrades(
                 resource_parts['resource_group'],
                 resource_parts['resource_name'],
                 current_config,
-                upgrade_plan
+                recommended_upgrades
             )
             
             if upgrade_results['success']:
@@ -109,17 +240,12 @@ class StorageAccountUpgradeAgent:
                     "success": True,
                     "resource_id": resource_id,
                     "upgrade_details": {
-                        "original_sku": current_config.sku.name.value if current_config.sku else "Unknown",
+                        "original_sku": current_sku,
                         "new_sku": upgrade_results['new_sku'],
-                        "upgrades_applied": upgrade_plan['recommended_upgrades'],
-                        "performance_improvements": upgrade_plan['benefits']
+                        "upgrades_applied": recommended_upgrades,
+                        "performance_improvements": [benefit for group in benefit_groups for benefit in group]
                     },
-                    "steps_completed": [
-                        "✅ Analyzed storage account configuration",
-                        "✅ Identified optimization opportunities", 
-                        "✅ Applied performance and efficiency upgrades",
-                        "✅ Validated new configuration"
-                    ]
+                    "steps_completed": _STEPS_COMPLETED
                 }
             else:
                 return {
@@ -128,7 +254,7 @@ class StorageAccountUpgradeAgent:
                 }
                 
         except Exception as e:
-            logger.error(f"Storage Account upgrade failed: {str(e)}")
+            logger.error("Storage Account upgrade failed: %s", e, exc_info=True)
             return {
                 "success": False,
                 "error": f"Upgrade process failed: {str(e)}",
@@ -137,148 +263,164 @@ class StorageAccountUpgradeAgent:
     
     def _parse_resource_id(self, resource_id: str) -> Optional[Dict[str, str]]:
         """Parse Azure resource ID into components."""
-        try:
-            parts = resource_id.strip('/').split('/')
-            if len(parts) >= 8 and 'storageAccounts' in parts:
-                return {
-                    'subscription_id': parts[1],
-                    'resource_group': parts[3],
-                    'resource_name': parts[-1]
-                }
-        except Exception as e:
-            logger.error(f"Failed to parse resource ID: {str(e)}")
-        return None
+        match = _RID_RE.match(resource_id)
+        if not match:
+            return None
+        return {
+            'subscription_id': match['sub'],
+            'resource_group': match['rg'],
+            'resource_name': match['name']
+        }
+    
+    def _properties_key(self, resource_group: str, account_name: str) -> tuple:
+        return (self.subscription_id, resource_group.lower(), account_name.lower())
     
     async def _get_storage_account_details(self, resource_group: str, account_name: str) -> Optional[StorageAccount]:
-        """Get current Storage Account configuration."""
+        """Get current Storage Account configuration (cached briefly - treat as read-only)."""
+        key = self._properties_key(resource_group, account_name)
+        cached = _cache_get(_properties_cache, key, PROPERTIES_CACHE_TTL_SECONDS)
+        if cached is not None:
+            return cached
         try:
-            storage_account = self.storage_client.storage_accounts.get_properties(
+            storage_account = await self.storage_client.storage_accounts.get_properties(
                 resource_group_name=resource_group,
                 account_name=account_name
             )
-            current_sku = storage_account.sku.name.value if storage_account.sku else "Unknown"
-            logger.info(f"Retrieved Storage Account details: {account_name} (SKU: {current_sku})")
+            _cache_put(_properties_cache, key, storage_account)
+            if logger.isEnabledFor(logging.INFO):
+                current_sku = storage_account.sku.name.value if storage_account.sku else "Unknown"
+                logger.info("Retrieved Storage Account details: %s (SKU: %s)", account_name, current_sku)
             return storage_account
         except Exception as e:
-            logger.error(f"Failed to get Storage Account details: {str(e)}")
+            logger.error("Failed to get Storage Account details: %s", e)
             return None
     
-    async def _analyze_upgrade_opportunities(self, storage_account: StorageAccount) -> Dict[str, Any]:
-        """Analyze the Storage Account for upgrade opportunities."""
+    async def _get_zone_redundant_sku_locations(self) -> Dict[str, set]:
+        """Map Standard_ZRS/Standard_GZRS to the (lower-cased) regions this subscription can use them in."""
+        cached = _cache_get(_sku_locations_cache, self.subscription_id, SKU_LOCATIONS_CACHE_TTL_SECONDS)
+        if cached is not None:
+            return cached
+        sku_locations = {'Standard_ZRS': set(), 'Standard_GZRS': set()}
+        async for sku in self.storage_client.skus.list():
+            sku_name = getattr(sku.name, 'value', sku.name)
+            if sku_name not in sku_locations or sku.restrictions:
+                continue
+            sku_locations[sku_name].update(location.lower() for location in sku.locations or [])
+        _cache_put(_sku_locations_cache, self.subscription_id, sku_locations)
+        return sku_locations
+    
+    def _iter_upgrade_opportunities(self, storage_account: StorageAccount,
+                                    sku_locations: Optional[Dict[str, set]] = None
+                                    ) -> Iterator[Tuple[Dict[str, str], Tuple[str, ...]]]:
+        """
+        Yield (upgrade, benefits) for each upgrade opportunity on the Storage Account.
+        
+        sku_locations is as returned by _get_zone_redundant_sku_locations; without it the
+        known zone-redundant regions are assumed.
+        """
         try:
-            upgrades_available = False
-            recommended_upgrades = []
-            benefits = []
-            
             current_sku = storage_account.sku.name.value if storage_account.sku else ""
             current_kind = storage_account.kind.value if storage_account.kind else ""
+            access_tier = getattr(storage_account, 'access_tier', None)
+            current_tier = getattr(access_tier, 'value', access_tier)
+            if (current_sku, current_kind, current_tier) in _OPTIMAL_STATES:
+                return
             
-            # Check for SKU upgrades
-            if current_sku in ['Standard_LRS', 'Standard_GRS']:
-                # Check if we can upgrade to ZRS or GZRS for better availability
-                if storage_account.location.lower() in ['eastus', 'westus2', 'northeurope', 'westeurope']:
-                    recommended_upgrades.append({
+            # Check for SKU upgrades to ZRS or GZRS for better availability
+            recommended_sku = _SKU_UPGRADES.get(current_sku)
+            if recommended_sku:
+                if sku_locations is not None:
+                    zone_redundant_regions = sku_locations.get(recommended_sku, frozenset())
+                else:
+                    zone_redundant_regions = _KNOWN_ZONE_REDUNDANT_REGIONS
+                if storage_account.location.lower() in zone_redundant_regions:
+                    yield {
                         'type': 'sku',
                         'current': current_sku,
-                        'recommended': 'Standard_ZRS' if current_sku == 'Standard_LRS' else 'Standard_GZRS',
+                        'recommended': recommended_sku,
                         'reason': 'Better availability and durability with zone redundancy'
-                    })
-                    benefits.append('Higher availability with zone redundancy')
-                    upgrades_available = True
+                    }, _SKU_BENEFITS
                     
             # Check for deprecated storage account types
             if current_kind == 'Storage':
-                recommended_upgrades.append({
+                yield {
                     'type': 'kind',
                     'current': current_kind,
                     'recommended': 'StorageV2',
                     'reason': 'StorageV2 provides access to latest features and better performance'
-                })
-                benefits.append('Access to latest storage features')
-                benefits.append('Better cost optimization options')
-                upgrades_available = True
+                }, _KIND_BENEFITS
                 
             # Check for access tier optimization
-            if (hasattr(storage_account, 'access_tier') and 
-                storage_account.access_tier and 
-                storage_account.access_tier.value == 'Hot' and
-                current_kind in ['StorageV2', 'BlobStorage']):
+            if current_tier == 'Hot' and current_kind in _TIERED_KINDS:
                 # This could be optimized but we'd need usage patterns to decide
                 # For now, we'll suggest enabling lifecycle management
-                recommended_upgrades.append({
+                yield {
                     'type': 'feature',
                     'current': 'Manual tier management',
                     'recommended': 'Lifecycle management policies',
                     'reason': 'Automatic cost optimization based on access patterns'
-                })
-                benefits.append('Automatic cost optimization')
-                upgrades_available = True
+                }, _TIER_BENEFITS
                 
-            return {
-                'upgrades_available': upgrades_available,
-                'recommended_upgrades': recommended_upgrades,
-                'benefits': benefits
-            }
-            
         except Exception as e:
-            logger.error(f"Upgrade analysis failed: {str(e)}")
-            return {
-                'upgrades_available': False,
-                'error': str(e)
-            }
+            logger.error("Upgrade analysis failed: %s", e, exc_info=True)
     
     async def _perform_upgrades(self, resource_group: str, account_name: str, 
-                               current_config: StorageAccount, upgrade_plan: Dict[str, Any]) -> Dict[str, Any]:
+                               current_config: StorageAccount, upgrades: Sequence[Dict[str, str]]) -> Dict[str, Any]:
         """Perform the actual Storage Account upgrades."""
         try:
             update_params = StorageAccountUpdateParameters()
-            new_sku = None
+            sku = current_config.sku
+            new_sku = sku.name.value if sku else "Unknown"
             
             # Apply recommended upgrades
-            for upgrade in upgrade_plan['recommended_upgrades']:
+            for upgrade in upgrades:
                 if upgrade['type'] == 'sku':
                     # Update SKU
                     new_sku_name = upgrade['recommended']
                     update_params.sku = Sku(name=SkuName(new_sku_name))
                     new_sku = new_sku_name
-                    logger.info(f"Upgrading SKU: {upgrade['current']} -> {new_sku_name}")
+                    logger.info("Upgrading SKU: %s -> %s", upgrade['current'], new_sku_name)
                     
                 elif upgrade['type'] == 'kind':
                     # Note: Kind cannot be changed after creation for existing storage accounts
                     # This would require creating a new storage account and migrating data
-                    logger.warning(f"Kind upgrade ({upgrade['current']} -> {upgrade['recommended']}) requires data migration")
+                    logger.warning("Kind upgrade (%s -> %s) requires data migration", upgrade['current'], upgrade['recommended'])
                     continue
                     
                 elif upgrade['type'] == 'feature':
                     # Enable additional features
-                    logger.info(f"Feature upgrade recommended: {upgrade['recommended']}")
+                    logger.info("Feature upgrade recommended: %s", upgrade['recommended'])
                     # Lifecycle management would be configured separately
                     continue
             
             # Perform the update if we have changes
             if update_params.sku:
-                logger.info(f"Applying Storage Account upgrades: {account_name}")
-                result = self.storage_client.storage_accounts.update(
+                logger.info("Applying Storage Account upgrades: %s", account_name)
+                result = await self.storage_client.storage_accounts.update(
                     resource_group_name=resource_group,
                     account_name=account_name,
                     parameters=update_params
                 )
+                # The update responds with the account's new state, so keep that as the cached copy
+                _cache_put(_properties_cache, self._properties_key(resource_group, account_name), result)
                 
-                logger.info(f"Storage Account upgrade completed: {account_name}")
+                logger.info("Storage Account upgrade completed: %s", account_name)
                 return {
                     'success': True,
-                    'new_sku': new_sku or (current_config.sku.name.value if current_config.sku else "Unknown"),
+                    'new_sku': new_sku,
                     'resource_id': result.id
                 }
             else:
                 return {
                     'success': True,
-                    'new_sku': current_config.sku.name.value if current_config.sku else "Unknown",
+                    'new_sku': new_sku,
                     'message': 'No immediate upgrades applied - some changes require data migration'
                 }
                 
         except Exception as e:
-            logger.error(f"Storage Account upgrade failed: {str(e)}")
+            logger.error("Storage Account upgrade failed: %s", e, exc_info=True)
+            # The account may have changed partway, so the next attempt should read it afresh
+            _properties_cache.pop(self._properties_key(resource_group, account_name), None)
             return {
                 'success': False,
                 'error': str(e)
@@ -298,3 +440,19 @@ async def upgrade_storage_account_automated(subscription_id: str, resource_id: s
     """
     agent = StorageAccountUpgradeAgent(subscription_id)
     return await agent.upgrade_storage_account(resource_id)
+
+async def upgrade_storage_accounts_automated(subscription_id: str, resource_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Upgrade many Storage Accounts concurrently on one agent.
+    
+    Args:
+        subscription_id: Azure subscription ID
+        resource_ids: Full resource IDs of the Storage Accounts to upgrade
+        
+    Returns:
+        One upgrade result per resource ID, in the order given. An ID given more than
+        once (ARM IDs are case-insensitive) is upgraded once and its result repeated.
+    """
+    # One upgrade per account: two at once would send competing updates
+    agent = StorageAccountUpgradeAgent(subscription_id)
+    return await upgrade_each_once(resource_ids, agent.upgrade_storage_account, MAX_CONCURRENT_UPGRADES)
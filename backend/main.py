@@ -46,6 +46,15 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Serve assets directly for frontend compatibility  
 app.mount("/assets", StaticFiles(directory="static/assets"), name="assets")
 
+@app.on_event("shutdown")
+async def close_agent_clients():
+    """Close pooled Azure SDK clients held by the upgrade agents, if they were loaded."""
+    import sys
+    for module_name in ("agents.upgrade_orchestrator", "agents.upgrade_public_ip", "agents.upgrade_storage_account"):
+        module = sys.modules.get(module_name)
+        if module:
+            await module.close_shared_clients()
+
 @app.get("/")
 def read_root():
     return FileResponse('static/index.html')
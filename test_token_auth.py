@@ -14,7 +14,7 @@ from pathlib import Path
 backend_path = Path(__file__).parent / "backend"
 sys.path.insert(0, str(backend_path))
 
-from agents.upgrade_public_ip import PublicIPUpgradeAgent
+from agents.upgrade_public_ip import PublicIPUpgradeAgent, SDK_CLIENTS_AVAILABLE
 
 async def test_token_based_upgrade():
     """Test the token-based Public IP upgrade functionality."""
@@ -46,7 +46,7 @@ async def test_token_based_upgrade():
         )
         
         print("✅ Agent initialized successfully!")
-        print(f"   • SDK Available: {agent.sdk_available}")
+        print(f"   • SDK Available: {SDK_CLIENTS_AVAILABLE}")
         print(f"   • Access Token: {'[PROVIDED]' if agent.access_token else '[MISSING]'}")
         print(f"   • HTTPX Available: {hasattr(agent, 'HTTPX_AVAILABLE') and agent.HTTPX_AVAILABLE}")
         print()
@@ -0,0 +1,492 @@
+"""
+Tests for the upgrade agents' concurrency, batching, caching and resume helpers.
+
+Every Azure call is stubbed out, so these run without credentials or the Azure SDK:
+    python -m pytest test_upgrade_concurrency.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from agents import upgrade_orchestrator, upgrade_public_ip, upgrade_storage_account
+
+PUBLIC_IP_ID = "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/publicIPAddresses/{}"
+STORAGE_ID = "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Storage/storageAccounts/{}"
+
+
+class FakeClock:
+    """Stands in for a module's `time`; sleep() advances the clock instead of waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+# AsyncRateLimiter
+
+def test_rate_limiter_bursts_then_waits_for_refill(monkeypatch, clock):
+    monkeypatch.setattr(upgrade_orchestrator, "time", clock)
+    monkeypatch.setattr(upgrade_orchestrator.asyncio, "sleep", clock.sleep)
+
+    async def scenario():
+        limiter = upgrade_orchestrator.AsyncRateLimiter(rate=2, period=10)
+        await limiter.acquire()
+        await limiter.acquire()
+        assert clock.sleeps == []
+
+        # Bucket empty: one token takes period / rate to refill
+        await limiter.acquire()
+        assert clock.sleeps == [pytest.approx(5)]
+
+    asyncio.run(scenario())
+
+
+def test_rate_limiter_refill_is_capped_at_rate(monkeypatch, clock):
+    monkeypatch.setattr(upgrade_orchestrator, "time", clock)
+    monkeypatch.setattr(upgrade_orchestrator.asyncio, "sleep", clock.sleep)
+
+    async def scenario():
+        limiter = upgrade_orchestrator.AsyncRateLimiter(rate=2, period=10)
+        await limiter.acquire()
+        await limiter.acquire()
+
+        # A long idle spell refills the bucket, but never beyond one full burst
+        clock.now += 1000
+        await limiter.acquire()
+        await limiter.acquire()
+        assert clock.sleeps == []
+        await limiter.acquire()
+        assert clock.sleeps == [pytest.approx(5)]
+
+    asyncio.run(scenario())
+
+
+# Batch entry points
+
+def test_upgrade_public_ips_upgrades_duplicates_once_in_input_order(monkeypatch):
+    monkeypatch.setattr(upgrade_public_ip, "HTTPX_AVAILABLE", False)
+    monkeypatch.setattr(upgrade_public_ip, "_standard_public_ips", upgrade_public_ip.collections.OrderedDict())
+    agent = upgrade_public_ip.PublicIPUpgradeAgent("sub")
+    calls = []
+
+    async def upgrade_public_ip_stub(resource_id):
+        calls.append(resource_id)
+        # Finish in reverse order of submission
+        await asyncio.sleep(0.01 * (3 - len(calls)))
+        if resource_id.endswith("broken"):
+            raise RuntimeError("boom")
+        return {"success": True, "resource_id": resource_id}
+
+    monkeypatch.setattr(agent, "upgrade_public_ip", upgrade_public_ip_stub)
+    ids = [PUBLIC_IP_ID.format("a"), PUBLIC_IP_ID.format("b"), PUBLIC_IP_ID.format("A"),
+           PUBLIC_IP_ID.format("broken"), PUBLIC_IP_ID.format("b")]
+
+    results = asyncio.run(agent.upgrade_public_ips(ids))
+
+    assert calls == [PUBLIC_IP_ID.format("a"), PUBLIC_IP_ID.format("b"), PUBLIC_IP_ID.format("broken")]
+    assert [r["resource_id"] for r in results] == [
+        PUBLIC_IP_ID.format("a"), PUBLIC_IP_ID.format("b"), PUBLIC_IP_ID.format("a"),
+        PUBLIC_IP_ID.format("broken"), PUBLIC_IP_ID.format("b")
+    ]
+    assert results[3]["success"] is False and "boom" in results[3]["error"]
+    # Repeats are equal but independent copies
+    assert results[1] == results[4] and results[1] is not results[4]
+
+
+def test_upgrade_storage_accounts_upgrades_duplicates_once_in_input_order(monkeypatch):
+    monkeypatch.setattr(upgrade_storage_account, "_get_storage_client", lambda subscription_id: None)
+    calls = []
+
+    async def upgrade_storage_account_stub(self, resource_id):
+        calls.append(resource_id)
+        await asyncio.sleep(0.01 * (3 - len(calls)))
+        return {"success": True, "resource_id": resource_id}
+
+    monkeypatch.setattr(upgrade_storage_account.StorageAccountUpgradeAgent, "upgrade_storage_account",
+                        upgrade_storage_account_stub)
+    ids = [STORAGE_ID.format("one"), STORAGE_ID.format("two"), STORAGE_ID.format("ONE")]
+
+    results = asyncio.run(upgrade_storage_account.upgrade_storage_accounts_automated("sub", ids))
+
+    assert calls == [STORAGE_ID.format("one"), STORAGE_ID.format("two")]
+    assert [r["resource_id"] for r in results] == [
+        STORAGE_ID.format("one"), STORAGE_ID.format("two"), STORAGE_ID.format("one")
+    ]
+    assert results[0] is not results[2]
+
+
+# Streaming orchestration
+
+def test_streaming_upgrade_cancels_leftover_tasks_when_consumer_stops():
+    orchestrator = upgrade_orchestrator.AutomatedUpgradeOrchestrator("sub")
+    fast_id = PUBLIC_IP_ID.format("fast")
+    slow_ids = [PUBLIC_IP_ID.format("slow1"), PUBLIC_IP_ID.format("slow2")]
+    cancelled = []
+
+    async def upgrade_resource_stub(resource_id, resource_type=None):
+        if resource_id == fast_id:
+            return {"success": True}
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(resource_id)
+            raise
+
+    orchestrator.upgrade_resource = upgrade_resource_stub
+
+    async def scenario():
+        stream = orchestrator.upgrade_multiple_resources_streaming(
+            [{"id": slow_ids[0]}, {"id": fast_id}, {"id": slow_ids[1]}]
+        )
+        first = await stream.__anext__()
+        assert first["resource_id"] == fast_id
+        await stream.aclose()
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert sorted(cancelled) == sorted(slow_ids)
+
+
+def test_token_is_passed_only_to_agents_that_take_it(monkeypatch):
+    calls = []
+
+    async def public_ip_agent(subscription_id, resource_id, access_token=None, tenant_id=None):
+        calls.append((resource_id, access_token, tenant_id))
+        return {"success": True}
+
+    async def storage_agent(subscription_id, resource_id):
+        calls.append((resource_id,))
+        return {"success": True}
+
+    monkeypatch.setitem(upgrade_orchestrator.AGENT_REGISTRY, "Microsoft.Network/publicIPAddresses", public_ip_agent)
+    monkeypatch.setitem(upgrade_orchestrator.AGENT_REGISTRY, "Microsoft.Storage/storageAccounts", storage_agent)
+    orchestrator = upgrade_orchestrator.AutomatedUpgradeOrchestrator("sub", access_token="token", tenant_id="tenant")
+
+    async def execute_both():
+        return await asyncio.gather(
+            orchestrator._execute_upgrade_agent("Microsoft.Network/publicIPAddresses", PUBLIC_IP_ID.format("pip")),
+            orchestrator._execute_upgrade_agent("Microsoft.Storage/storageAccounts", STORAGE_ID.format("sa"))
+        )
+
+    assert asyncio.run(execute_both()) == [{"success": True}, {"success": True}]
+    assert calls == [(PUBLIC_IP_ID.format("pip"), "token", "tenant"), (STORAGE_ID.format("sa"),)]
+
+
+# Caches
+
+def test_storage_cache_expires_and_evicts_on_read(monkeypatch, clock):
+    monkeypatch.setattr(upgrade_storage_account, "time", clock)
+    cache = {}
+    upgrade_storage_account._cache_put(cache, "key", "value")
+
+    clock.now += 59
+    assert upgrade_storage_account._cache_get(cache, "key", ttl=60) == "value"
+    clock.now += 2
+    assert upgrade_storage_account._cache_get(cache, "key", ttl=60) is None
+    assert "key" not in cache
+
+
+def test_storage_cache_is_bounded_oldest_first(monkeypatch, clock):
+    monkeypatch.setattr(upgrade_storage_account, "time", clock)
+    monkeypatch.setattr(upgrade_storage_account, "CACHE_MAX_ENTRIES", 2)
+    cache = {}
+    upgrade_storage_account._cache_put(cache, "a", 1)
+    upgrade_storage_account._cache_put(cache, "b", 2)
+    # Refreshing "a" makes "b" the oldest
+    upgrade_storage_account._cache_put(cache, "a", 3)
+    upgrade_storage_account._cache_put(cache, "c", 4)
+
+    assert list(cache) == ["a", "c"]
+    assert upgrade_storage_account._cache_get(cache, "a", ttl=60) == 3
+
+
+def test_standard_public_ip_cache_expires_and_is_bounded(monkeypatch, clock):
+    monkeypatch.setattr(upgrade_public_ip, "time", clock)
+    monkeypatch.setattr(upgrade_public_ip, "_standard_public_ips", upgrade_public_ip.collections.OrderedDict())
+    monkeypatch.setattr(upgrade_public_ip, "STANDARD_SKU_CACHE_MAX_ENTRIES", 2)
+
+    upgrade_public_ip._remember_standard(PUBLIC_IP_ID.format("A"))
+    assert upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("a"))
+
+    clock.now += upgrade_public_ip.STANDARD_SKU_CACHE_TTL_SECONDS
+    assert not upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("a"))
+    assert len(upgrade_public_ip._standard_public_ips) == 0
+
+    for name in ("x", "y", "z"):
+        upgrade_public_ip._remember_standard(PUBLIC_IP_ID.format(name))
+    assert not upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("x"))
+    assert upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("z"))
+
+
+# Request bodies
+
+def _fetched_nic():
+    return {
+        "id": "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/networkInterfaces/nic",
+        "location": "westeurope",
+        "etag": "W/\"1\"",
+        "extendedLocation": {"name": "edge", "type": "EdgeZone"},
+        "properties": {
+            "nicType": "Standard",
+            "auxiliaryMode": "None",
+            "disableTcpStateTracking": False,
+            "ipConfigurations": [
+                {"name": "ipconfig1", "properties": {
+                    "subnet": {"id": "subnet"},
+                    "gatewayLoadBalancer": {"id": "gwlb"},
+                    "virtualNetworkTaps": [{"id": "tap"}],
+                    "privateIPAddressPrefixLength": 28,
+                    "publicIPAddress": {"id": PUBLIC_IP_ID.format("pip")}
+                }},
+                {"name": "ipconfig2", "properties": {"publicIPAddress": {"id": PUBLIC_IP_ID.format("other")}}}
+            ]
+        }
+    }
+
+
+def test_nic_body_changes_only_the_target_public_ip():
+    nic = _fetched_nic()
+
+    detached = upgrade_public_ip._nic_with_public_ip(nic, "ipconfig1", None)
+    attached = upgrade_public_ip._nic_with_public_ip(detached, "ipconfig1", PUBLIC_IP_ID.format("new"))
+
+    expected = _fetched_nic()
+    del expected["properties"]["ipConfigurations"][0]["properties"]["publicIPAddress"]
+    assert detached == expected
+    expected["properties"]["ipConfigurations"][0]["properties"]["publicIPAddress"] = {"id": PUBLIC_IP_ID.format("new")}
+    assert attached == expected
+    # The fetched NIC is left as it was
+    assert nic == _fetched_nic()
+
+
+def test_standard_sku_body_keeps_everything_but_the_association():
+    public_ip = {
+        "id": PUBLIC_IP_ID.format("pip"),
+        "location": "westeurope",
+        "extendedLocation": {"name": "edge", "type": "EdgeZone"},
+        "sku": {"name": "Basic", "tier": "Regional"},
+        "properties": {
+            "publicIPAllocationMethod": "Dynamic",
+            "ipAddress": "20.0.0.1",
+            "deleteOption": "Detach",
+            "linkedPublicIPAddress": {"id": PUBLIC_IP_ID.format("linked")},
+            "ipConfiguration": {"id": "ipconfig"}
+        }
+    }
+
+    body = upgrade_public_ip._standard_sku_body(public_ip)
+
+    assert body["sku"] == {"name": "Standard", "tier": "Regional"}
+    assert body["extendedLocation"] == public_ip["extendedLocation"]
+    assert body["properties"] == {
+        "publicIPAllocationMethod": "Static",
+        "ipAddress": "20.0.0.1",
+        "deleteOption": "Detach",
+        "linkedPublicIPAddress": {"id": PUBLIC_IP_ID.format("linked")}
+    }
+    assert public_ip["sku"]["name"] == "Basic" and "ipConfiguration" in public_ip["properties"]
+
+
+# Caching an HTTP-path SKU upgrade
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(body or {}).encode()
+        self.headers = headers or {}
+        self.text = self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeHTTPClient:
+    """Serves a Basic, unattached Public IP; the SKU PUT answers with put_response."""
+
+    def __init__(self, put_response, operation_status="Succeeded"):
+        self.put_response = put_response
+        self.operation_status = operation_status
+
+    async def get(self, url, headers=None):
+        if url == "https://operation":
+            return FakeResponse(200, {"status": self.operation_status})
+        return FakeResponse(200, {"id": PUBLIC_IP_ID.format("pip"), "sku": {"name": "Basic"}, "properties": {}})
+
+    async def put(self, url, headers=None, content=None):
+        return self.put_response
+
+
+def _http_upgrade(monkeypatch, client):
+    monkeypatch.setattr(upgrade_public_ip, "_get_http_client", lambda: client)
+    monkeypatch.setattr(upgrade_public_ip, "_standard_public_ips", upgrade_public_ip.collections.OrderedDict())
+    agent = upgrade_public_ip.PublicIPUpgradeAgent("sub", access_token="token")
+    return asyncio.run(agent._upgrade_via_http(PUBLIC_IP_ID.format("pip")))
+
+
+def test_http_upgrade_accepted_without_operation_is_not_cached(monkeypatch):
+    result = _http_upgrade(monkeypatch, FakeHTTPClient(FakeResponse(202)))
+
+    assert result["success"] is True
+    assert not upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("pip"))
+
+
+def test_http_upgrade_is_cached_once_its_operation_succeeds(monkeypatch):
+    accepted = FakeResponse(202, headers={"Azure-AsyncOperation": "https://operation"})
+
+    result = _http_upgrade(monkeypatch, FakeHTTPClient(accepted))
+
+    assert result["success"] is True
+    assert upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("pip"))
+
+
+def test_http_upgrade_failed_operation_is_reported_and_not_cached(monkeypatch):
+    accepted = FakeResponse(202, headers={"Azure-AsyncOperation": "https://operation"})
+
+    result = _http_upgrade(monkeypatch, FakeHTTPClient(accepted, operation_status="Failed"))
+
+    assert result["success"] is False and "Failed" in result["error"]
+    assert not upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("pip"))
+
+
+def test_http_upgrade_completed_on_standard_is_cached(monkeypatch):
+    completed = FakeResponse(200, {"id": PUBLIC_IP_ID.format("pip"), "sku": {"name": "Standard"}})
+
+    _http_upgrade(monkeypatch, FakeHTTPClient(completed))
+
+    assert upgrade_public_ip._is_known_standard(PUBLIC_IP_ID.format("pip"))
+
+
+# Concurrent NIC updates
+
+NIC_ID = "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/networkInterfaces/nic"
+
+
+class FakeNICClient:
+    """One NIC with two IP configurations; yields between serving a GET and applying a PUT."""
+
+    def __init__(self):
+        self.nic = _fetched_nic()
+        for ip_config in self.nic["properties"]["ipConfigurations"]:
+            del ip_config["properties"]["publicIPAddress"]
+
+    async def get(self, url, headers=None):
+        await asyncio.sleep(0)
+        return FakeResponse(200, self.nic)
+
+    async def put(self, url, headers=None, content=None):
+        await asyncio.sleep(0)
+        self.nic = json.loads(content)
+        return FakeResponse(200, self.nic)
+
+
+def test_concurrent_reassociations_on_one_nic_keep_both_public_ips():
+    client = FakeNICClient()
+    agent = upgrade_public_ip.PublicIPUpgradeAgent("sub", access_token="token")
+
+    async def reassociate_both():
+        return await asyncio.gather(*(
+            agent._reassociate_public_ip_http(f"{NIC_ID}/ipConfigurations/{name}", PUBLIC_IP_ID.format(name),
+                                              client, {})
+            for name in ("ipconfig1", "ipconfig2")
+        ))
+
+    results = asyncio.run(reassociate_both())
+
+    assert all(result["success"] for result in results)
+    assert {ip_config["name"]: ip_config["properties"]["publicIPAddress"]["id"]
+            for ip_config in client.nic["properties"]["ipConfigurations"]} == {
+        "ipconfig1": PUBLIC_IP_ID.format("ipconfig1"), "ipconfig2": PUBLIC_IP_ID.format("ipconfig2")
+    }
+
+
+# Resuming an SDK-path SKU upgrade
+
+ATTACHMENT = {"type": "network_interface", "nic_name": "nic", "config_name": "ipconfig1",
+              "resource_group": "rg", "public_ip_id": PUBLIC_IP_ID.format("pip")}
+
+
+class FakePublicIPAddresses:
+    """Stands in for network_client.public_ip_addresses; records resumed continuation tokens."""
+
+    def __init__(self, sku):
+        self.public_ip = SimpleNamespace(id=PUBLIC_IP_ID.format("pip"), sku=SimpleNamespace(name=sku),
+                                         ip_configuration=None, public_ip_allocation_method="Static")
+        self.resumed = []
+
+    async def get(self, resource_group, name):
+        return self.public_ip
+
+    async def begin_create_or_update(self, resource_group, name, body, continuation_token=None, polling=None):
+        self.resumed.append(continuation_token)
+        return SimpleNamespace(continuation_token=lambda: continuation_token)
+
+
+def _sdk_agent(monkeypatch, sku):
+    public_ips = FakePublicIPAddresses(sku)
+    monkeypatch.setattr(upgrade_public_ip, "_get_async_network_client",
+                        lambda subscription_id: SimpleNamespace(public_ip_addresses=public_ips))
+    monkeypatch.setattr(upgrade_public_ip, "_fast_async_polling", lambda: None)
+    monkeypatch.setattr(upgrade_public_ip, "_standard_public_ips", upgrade_public_ip.collections.OrderedDict())
+    monkeypatch.setattr(upgrade_public_ip, "_pending_sku_upgrades", {
+        PUBLIC_IP_ID.format("pip").lower(): upgrade_public_ip._PendingSkuUpgrade("token", [ATTACHMENT])
+    })
+    agent = upgrade_public_ip.PublicIPUpgradeAgent("sub")
+    reassociated = []
+
+    async def perform_reassociation_stub(network_client, attachment, resource_group, public_ip_name):
+        reassociated.append(attachment)
+
+    monkeypatch.setattr(agent, "_perform_reassociation", perform_reassociation_stub)
+    return agent, public_ips, reassociated
+
+
+def test_sdk_upgrade_finished_meanwhile_restores_the_detached_nic(monkeypatch):
+    agent, public_ips, reassociated = _sdk_agent(monkeypatch, "Standard")
+
+    result = asyncio.run(agent._upgrade_via_sdk(PUBLIC_IP_ID.format("pip")))
+
+    assert result["success"] is True and not result.get("no_change_required")
+    assert public_ips.resumed == []
+    assert reassociated == [ATTACHMENT]
+    assert upgrade_public_ip._pending_sku_upgrades == {}
+
+
+def test_sdk_upgrade_resume_timeout_keeps_token_and_asks_for_action(monkeypatch):
+    agent, public_ips, reassociated = _sdk_agent(monkeypatch, "Basic")
+
+    async def lro_result_timeout(poller, timeout):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(upgrade_public_ip, "_lro_result", lro_result_timeout)
+
+    result = asyncio.run(agent._upgrade_via_sdk(PUBLIC_IP_ID.format("pip")))
+
+    assert public_ips.resumed == ["token"]
+    assert result["success"] is False and result["manual_action_required"] is True
+    assert result["error"] and "nic/ipconfig1" in result["message"]
+    assert reassociated == []
+    assert PUBLIC_IP_ID.format("pip").lower() in upgrade_public_ip._pending_sku_upgrades